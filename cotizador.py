@@ -1,34 +1,71 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
-from datetime import datetime
-from fpdf import FPDF
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
 import json
 from pathlib import Path
-import csv
-import smtplib
-from email.message import EmailMessage
 import os
 import sys
 import subprocess
 import re
-import difflib
+import unicodedata
+from bisect import bisect_left, insort
 import shutil
-import uuid
+from collections import deque, namedtuple
+from contextlib import contextmanager
+import copy
+import importlib.util
+import io
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# tkcalendar (y babel, que arrastra) se importa recién al abrir el calendario;
+# al arrancar solo se verifica que esté instalado
+TKCALENDAR_DISPONIBLE = importlib.util.find_spec("tkcalendar") is not None
+
+# Opcional: orjson acelera la lectura/escritura de historial y configuración
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+# Opcional: rapidfuzz (C++) reemplaza a difflib en las sugerencias con errores de tipeo
 try:
-    from tkcalendar import DateEntry
+    from rapidfuzz import process as rf_process, fuzz as rf_fuzz, utils as rf_utils
 except ImportError:
-    DateEntry = None
+    rf_process = None
 
 # Nota: para vista previa de imágenes instalar Pillow:
 # pip install pillow
 
 CONFIG_PATH = Path("config_cotizador.json")
-HIST_PATH = Path("historial_cotizaciones.json")
+CORRELATIVO_PATH = Path("correlativo_cotizador.txt")  # Se reescribe en cada PDF
+HIST_PATH = Path("historial_cotizaciones.jsonl")
+LEGACY_HIST_PATH = Path("historial_cotizaciones.json")  # Formato anterior (lista JSON)
 IGV_RATE = 0.18
 
-# Regex compiladas para mejor performance
-EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+# Regex compiladas para mejor performance (usar con fullmatch)
+EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+RUC_PATTERN = re.compile(r"\d{11}", re.ASCII)  # ASCII: str.isdigit() acepta dígitos unicode
+RUC_FACTORES = (5, 4, 3, 2, 7, 6, 5, 4, 3, 2)  # Pesos del dígito verificador
+NOMBRE_ARCHIVO_INVALIDO = re.compile(r"[^\w\s\-_.]")
+ESPACIOS_PATTERN = re.compile(r"\s+")
+# Equivalente a NOMBRE_ARCHIVO_INVALIDO para texto ASCII, aplicado con str.translate
+TABLA_ARCHIVO_ASCII = str.maketrans({
+    c: None for c in map(chr, range(128))
+    if not (c.isalnum() or c.isspace() or c in "-_.")
+})
+NUMERO_PATTERN = re.compile(r"-?(\d+(\.\d*)?|\.\d+)")  # Número completo
+NUMERO_PARCIAL_PATTERN = re.compile(r"-?\d*\.?\d{0,2}")  # Mientras se escribe
+CANTIDAD_PARCIAL_PATTERN = re.compile(r"-?\d*\.?\d{0,3}")  # Cantidad: 3 decimales
+
+# Ítem de la cotización en memoria (montos en centavos, cantidad en milésimas);
+# la Treeview solo lo muestra
+ItemRow = namedtuple("ItemRow", "desc cant_m precio_c sub_c iid")
 
 # Constantes de símbolos de moneda (para evitar recrear dict en cada iteración)
 SIMBOLOS_MONEDA = {"SOLES": "S/", "DOLARES": "$", "EUROS": "€"}
@@ -36,12 +73,31 @@ SIMBOLOS_MONEDA = {"SOLES": "S/", "DOLARES": "$", "EUROS": "€"}
 # Formatos de fecha para parsing flexible
 FORMATOS_FECHA = ["%Y-%m-%d", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S"]
 
+# Filas del historial insertadas por ciclo de eventos (mantiene la ventana fluida)
+LOTE_HISTORIAL = 200
+
+# Máximo de sugerencias del autocompletado de clientes
+MAX_SUGERENCIAS = 20
+
+# Miniaturas de vista previa guardadas en memoria
+MAX_MINIATURAS = 64
+
+# Barra de estado: tipo -> ((fondo, texto) normal, (fondo, texto) atenuado del parpadeo)
+COLORES_ESTADO = {
+    "success": (("#d4edda", "#155724"), ("#e8f5e9", "#4caf50")),  # Verde
+    "error": (("#f8d7da", "#721c24"), ("#ffebee", "#ef5350")),    # Rojo
+    "warning": (("#fff3cd", "#856404"), ("#fffde7", "#fbc02d")),  # Amarillo / naranja
+    "info": (("#cce5ff", "#0052cc"), ("#e3f2fd", "#90caf9")),     # Azul (más llamativo)
+}
+
 
 # ==== HELPERS GENERALES ===============================================
+@lru_cache(maxsize=None)
 def get_base_dir() -> Path:
     """
     Devuelve el directorio base de la app (donde está el ejecutable o script).
     Compatible con script normal y ejecutable (PyInstaller/cx_Freeze).
+    Se calcula una sola vez: resolve() consulta el disco y la ruta no cambia.
     """
     if getattr(sys, "frozen", False):
         # Si es ejecutable, usar el directorio del ejecutable
@@ -50,20 +106,223 @@ def get_base_dir() -> Path:
     return Path(sys.argv[0]).resolve().parent
 
 
+def json_dumps(data) -> str:
+    """Serializa a JSON compacto y UTF-8 (con orjson si está instalado)."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def json_loads(texto):
+    """
+    Parsea JSON desde str o bytes UTF-8 (con orjson si está instalado).
+    Lanza ValueError si es inválido.
+    """
+    if orjson is not None:
+        return orjson.loads(texto)
+    return json.loads(texto)
+
+
 def load_json_safe(path: Path, default):
     try:
         if path.exists():
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            # Se parsean los bytes tal cual: sin decodificar a str antes
+            return json_loads(path.read_bytes())
     except Exception:
         pass
     return default
 
 
-def save_json_safe(path: Path, data):
+def save_json_safe(path: Path, data, sincronizar: bool = False):
+    """
+    Escribe a un archivo temporal y lo reemplaza: nunca deja el JSON a medias.
+    Con `sincronizar` el temporal se lleva a disco (fsync) antes del reemplazo,
+    para que un corte de luz no deje el archivo vacío; solo desde hilos de fondo.
+    """
+    try:
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            # JSON compacto: sin indentación, menos bytes que serializar y escribir
+            f.write(json_dumps(data))
+            if sincronizar:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def load_correlativo(path: Path = CORRELATIVO_PATH) -> int:
+    """Lee el último correlativo guardado (0 si no existe o es inválido)."""
+    try:
+        return int(path.read_text(encoding="ascii").strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def save_correlativo(valor: int, path: Path = CORRELATIVO_PATH):
+    """Guarda solo el correlativo: unos pocos bytes y un os.replace atómico."""
+    try:
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(str(valor), encoding="ascii")
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def limpiar_imagenes_temporales(carpeta: Path, antiguedad: float = 86400, excluir=()) -> int:
+    """
+    Borra las imágenes TMP_* de `carpeta` con más de `antiguedad` segundos,
+    salvo las rutas en `excluir`. Un solo recorrido con os.scandir.
+    Retorna cuántas se borraron.
+    """
+    limite = time.time() - antiguedad
+    excluir = {os.path.normcase(os.path.abspath(p)) for p in excluir}
+    borradas = 0
+    try:
+        with os.scandir(carpeta) as it:
+            for entry in it:
+                if not entry.name.startswith("TMP_"):
+                    continue
+                try:
+                    if not entry.is_file() or entry.stat().st_mtime > limite:
+                        continue
+                    if os.path.normcase(os.path.abspath(entry.path)) in excluir:
+                        continue
+                    os.unlink(entry.path)
+                    borradas += 1
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return borradas
+
+
+def iter_historial(path: Path = HIST_PATH):
+    """
+    Recorre el historial en formato JSON Lines registro por registro, sin
+    cargar el archivo completo en memoria.
+    Las líneas vacías o corruptas (p. ej. una escritura interrumpida) se omiten.
+    """
+    try:
+        if not path.exists():
+            return
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json_loads(line)
+                except ValueError:
+                    continue
+    except Exception:
+        return
+
+
+# Historial ya parseado por ruta: {path: ((st_mtime_ns, st_size), registros)}
+_HIST_CACHE = {}
+
+
+def _firma_archivo(path: Path):
+    """(mtime_ns, tamaño) del archivo, o None si no existe."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def load_historial(path: Path = HIST_PATH) -> list:
+    """
+    Lee el historial completo como lista de registros.
+    Se vuelve a parsear solo si el archivo cambió (mtime/tamaño); si no, se
+    reutilizan los registros ya leídos. La lista devuelta es nueva, pero los
+    registros son compartidos: si se modifican, guardar con save_historial.
+    """
+    firma = _firma_archivo(path)
+    if firma is None:
+        _HIST_CACHE.pop(path, None)
+        return []
+
+    cache = _HIST_CACHE.get(path)
+    if cache is None or cache[0] != firma:
+        cache = (firma, list(iter_historial(path)))
+        _HIST_CACHE[path] = cache
+    return list(cache[1])
+
+
+def append_historial(registro: dict, path: Path = HIST_PATH):
+    """
+    Agrega un registro al final del historial sin reescribir el archivo.
+    Si el caché estaba al día, se le agrega el registro en vez de descartarlo.
+    Si la última línea quedó cortada (escritura interrumpida), el registro va
+    en una línea nueva para no pegarse a ella y perderse con ella.
+    """
+    cache = _HIST_CACHE.pop(path, None)
+    try:
+        al_dia = cache is not None and cache[0] == _firma_archivo(path)
+        linea = (json_dumps(registro) + "\n").encode("utf-8")
+        with open(path, "a+b") as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    linea = b"\n" + linea
+            f.write(linea)
+        if al_dia:
+            cache[1].append(registro)
+            _HIST_CACHE[path] = (_firma_archivo(path), cache[1])
+    except Exception:
+        pass
+
+
+def save_historial(data: list, path: Path = HIST_PATH) -> bool:
+    """
+    Reescribe el historial completo (solo al editar registros existentes).
+    Igual que save_json_safe: se escribe a un temporal y se reemplaza con os.replace.
+    Retorna True si el archivo quedó escrito.
+    """
+    _HIST_CACHE.pop(path, None)
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json_dumps(r) + "\n" for r in data)
+        os.replace(tmp, path)
+        # Lo recién escrito ya es el contenido del archivo: no hace falta releerlo
+        _HIST_CACHE[path] = (_firma_archivo(path), list(data))
+        return True
+    except Exception:
+        return False
+
+
+def actualizar_historial(cambiar, path: Path = HIST_PATH):
+    """
+    Relee el historial, aplica cambiar(registro) a cada registro y lo reescribe
+    si alguno cambió (cambiar retorna True en ese caso).
+    Se parte del archivo y no de una lista tomada antes, para no perder los
+    registros agregados mientras tanto (p. ej. por un PDF en segundo plano).
+    """
+    data = load_historial(path)
+    cambiados = [r for r in data if cambiar(r)]
+    if cambiados:
+        save_historial(data, path)
+    return len(cambiados)
+
+
+def migrar_historial_legacy(legacy_path: Path = LEGACY_HIST_PATH, path: Path = HIST_PATH):
+    """
+    Convierte el historial antiguo (lista JSON) a JSON Lines una sola vez.
+    El archivo antiguo se conserva renombrado como respaldo (.bak), solo si el
+    nuevo se pudo escribir; si no, se reintenta en el próximo inicio.
+    """
+    if path.exists() or not legacy_path.exists():
+        return
+    data = load_json_safe(legacy_path, [])
+    if not isinstance(data, list):
+        return
+    if not save_historial(data, path):
+        return
+    try:
+        legacy_path.replace(legacy_path.with_name(legacy_path.name + ".bak"))
     except Exception:
         pass
 
@@ -84,6 +343,7 @@ def get_referencias_dir(config: dict) -> Path:
     return get_base_dir() / "Referencias"
 
 
+@lru_cache(maxsize=4096)
 def parse_numero_version(numero: str) -> tuple:
     """
     Parsea un número de cotización con versión.
@@ -101,17 +361,108 @@ def parse_numero_version(numero: str) -> tuple:
         return numero, 1
 
 
+def normalizar_busqueda(texto: str) -> str:
+    """
+    Clave de búsqueda sin mayúsculas ni tildes, para comparar nombres de clientes.
+    Ejemplo: "Ñandú S.A." -> "nandu s.a."
+    """
+    if texto.isascii():
+        return texto.casefold()
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def nombre_archivo_seguro(texto: str, por_defecto: str = "SinCliente") -> str:
+    """
+    Limpia un texto para usarlo en un nombre de archivo.
+    Quita caracteres no permitidos y une los espacios (de cualquier largo) con "_".
+    Ejemplo: "Perez & Hijos   S.A." -> "Perez_Hijos_S.A."
+    """
+    if texto.isascii():
+        limpio = texto.translate(TABLA_ARCHIVO_ASCII).strip()
+    else:
+        limpio = NOMBRE_ARCHIVO_INVALIDO.sub("", texto).strip()
+    return ESPACIOS_PATTERN.sub("_", limpio) or por_defecto
+
+
+def _a_entero(valor, decimales: int) -> int:
+    """Convierte un número (str, int o float) a entero en unidades de 10**-decimales."""
+    try:
+        numero = Decimal(str(valor).strip())
+    except InvalidOperation:
+        raise ValueError(f"Número inválido: {valor!r}")
+    if not numero.is_finite():
+        raise ValueError(f"Número inválido: {valor!r}")
+    return int(numero.scaleb(decimales).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def a_centavos(valor) -> int:
+    """
+    Convierte un monto (str, int o float) a centavos enteros.
+    Redondea a 2 decimales (mitad hacia arriba). Lanza ValueError si no es número.
+    Ejemplo: "12.345" -> 1235
+    """
+    return _a_entero(valor, 2)
+
+
+def a_milesimas(valor) -> int:
+    """
+    Convierte una cantidad (str, int o float) a milésimas enteras.
+    Redondea a 3 decimales (mitad hacia arriba). Lanza ValueError si no es número.
+    Ejemplo: "0.125" -> 125
+    """
+    return _a_entero(valor, 3)
+
+
+def multiplicar_centavos(cant_m: int, precio_c: int) -> int:
+    """Multiplica cantidad (en milésimas) por precio (en centavos) y retorna centavos."""
+    return int((Decimal(cant_m * precio_c) / 1000).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def formatear_cantidad(milesimas: int) -> str:
+    """Formatea una cantidad: 2000 -> "2.00", 125 -> "0.125" (3 decimales solo si hacen falta)."""
+    signo = "-" if milesimas < 0 else ""
+    entero, mil = divmod(abs(milesimas), 1000)
+    if mil % 10:
+        return f"{signo}{entero}.{mil:03d}"
+    return f"{signo}{entero}.{mil // 10:02d}"
+
+
+def formatear_centavos(centavos: int, miles: bool = False) -> str:
+    """Formatea centavos para mostrar: 123456 -> "1234.56" (o "1,234.56" con miles)."""
+    signo = "-" if centavos < 0 else ""
+    entero, cent = divmod(abs(centavos), 100)
+    entero_txt = f"{entero:,}" if miles else str(entero)
+    return f"{signo}{entero_txt}.{cent:02d}"
+
+
+@lru_cache(maxsize=4096)
+def formatear_monto(simbolo: str, centavos: int) -> str:
+    """Monto para mostrar con símbolo y miles: ("S/", 123456) -> "S/ 1,234.56" (cacheado)."""
+    return f"{simbolo} {formatear_centavos(centavos, miles=True)}"
+
+
+@lru_cache(maxsize=4096)
 def parse_fecha_flexible(fecha_str: str):
     """
     Parsea fecha con múltiples formatos sin recrear lista cada vez.
     Retorna: datetime.date o None
-    Optimización: usa constante FORMATOS_FECHA en lugar de recrear lista
+    Optimización: usa constante FORMATOS_FECHA en lugar de recrear lista;
+    el resultado (inmutable) se memoriza para las mismas cadenas
     """
     if not fecha_str:
         return None
     
     fecha_base = fecha_str.split()[0]  # Tomar solo la fecha sin hora
     
+    # Camino rápido para AAAA-MM-DD (el formato del historial): fromisoformat
+    # no pasa por strptime; cualquier otra forma sigue con la lista de formatos
+    if len(fecha_base) == 10 and fecha_base[4] == "-" and fecha_base[7] == "-":
+        try:
+            return date.fromisoformat(fecha_base)
+        except ValueError:
+            pass
+    
     for fmt in FORMATOS_FECHA:
         try:
             return datetime.strptime(fecha_base, fmt).date()
@@ -126,35 +477,117 @@ def validar_ruc_peruano(ruc: str) -> bool:
     Valida un RUC peruano incluyendo el dígito verificador.
     RUC tiene 11 dígitos y el último es un dígito verificador.
     """
-    if not ruc or not ruc.isdigit() or len(ruc) != 11:
+    if not ruc or not RUC_PATTERN.fullmatch(ruc):
         return False
     
-    # Algoritmo de validación del RUC peruano
-    factores = [5, 4, 3, 2, 7, 6, 5, 4, 3, 2]
-    suma = sum(int(ruc[i]) * factores[i] for i in range(10))
-    resto = suma % 11
-    digito_verificador = 11 - resto if resto != 0 else 0
-    
-    # Si el resultado es 10 o 11, el dígito verificador es 0
-    if digito_verificador >= 10:
-        digito_verificador = 0
+    # Algoritmo de validación del RUC peruano (zip corta en el décimo dígito)
+    suma = sum(int(d) * f for d, f in zip(ruc, RUC_FACTORES))
+    # 11 - resto, donde 10 u 11 equivalen a 0
+    digito_verificador = (11 - suma % 11) % 11 % 10
     
     return int(ruc[10]) == digito_verificador
 
 
 # ==== PDF ==============================================================
 
-class CotizadorPDF(FPDF):
+# fpdf se importa recién al generar el primer PDF (arranque más rápido).
+# La clase real CotizadorPDF(_CotizadorPDFMixin, FPDF) se arma en get_clase_pdf().
+_PDF_CLS = None
+
+
+def get_clase_pdf():
+    """Retorna la clase CotizadorPDF, importando fpdf la primera vez."""
+    global _PDF_CLS
+    if _PDF_CLS is None:
+        from fpdf import FPDF
+        _PDF_CLS = type("CotizadorPDF", (_CotizadorPDFMixin, FPDF), {})
+    return _PDF_CLS
+
+
+def __getattr__(name):
+    # Permite `from cotizador import CotizadorPDF` sin importar fpdf al cargar el módulo
+    if name == "CotizadorPDF":
+        return get_clase_pdf()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Ajuste de texto ya calculado: {(fuente, estilo, tamaño, ancho, texto): líneas}
+_LINEAS_PDF_CACHE = {}
+_MAX_LINEAS_PDF_CACHE = 1024
+
+
+def partir_lineas_pdf(pdf, w, h, texto) -> tuple:
+    """
+    Parte `texto` en las líneas que ocuparía en un multi_cell de ancho `w`.
+    Se memoriza por fuente/tamaño/ancho/texto: descripciones repetidas (mismos
+    productos en varias cotizaciones) no vuelven a medirse carácter por carácter.
+    """
+    key = (pdf.font_family, pdf.font_style, pdf.font_size_pt, w, texto)
+    lineas = _LINEAS_PDF_CACHE.get(key)
+    if lineas is None:
+        if len(_LINEAS_PDF_CACHE) >= _MAX_LINEAS_PDF_CACHE:
+            _LINEAS_PDF_CACHE.clear()
+        lineas = tuple(pdf.multi_cell(w, h, texto, split_only=True))
+        _LINEAS_PDF_CACHE[key] = lineas
+    return lineas
+
+
+def cota_lineas_pdf(pdf, w, texto) -> float:
+    """
+    Cota superior de las líneas que ocuparía `texto` en un multi_cell de ancho
+    `w`, sin partirlo: solo suma anchos de caracteres.
+    Cada línea que no cierra un párrafo consume más que el ancho útil menos la
+    palabra más ancha y un espacio. Con palabras casi tan anchas como la celda
+    no hay cota y se retorna infinito.
+    """
+    palabras = texto.replace("\n", " ").split(" ")
+    consumo_min = (w - 2 * pdf.c_margin
+                   - max(pdf.get_string_width(p) for p in palabras)
+                   - pdf.get_string_width(" "))
+    if consumo_min <= 0:
+        return float("inf")
+    return texto.count("\n") + 1 + pdf.get_string_width(texto) / consumo_min
+
+
+# Logo ya leído: {ruta: ((mtime_ns, tamaño), bytes)}
+_LOGO_CACHE = {}
+
+
+def leer_logo(path) -> bytes:
+    """Devuelve los bytes del logo, releyendo el archivo solo si cambió."""
+    st = os.stat(path)
+    clave = (st.st_mtime_ns, st.st_size)
+    cache = _LOGO_CACHE.get(path)
+    if cache is None or cache[0] != clave:
+        cache = (clave, Path(path).read_bytes())
+        _LOGO_CACHE[path] = cache
+    return cache[1]
+
+
+class _CotizadorPDFMixin:
+    """Encabezado y pie de página de la cotización (se combina con FPDF)."""
+
+    # Atributos propios en slots: header() los lee en cada página. FPDF no
+    # define slots, así que el resto del estado sigue en el __dict__ normal
+    __slots__ = ("logo_path", "empresa", "numero", "_logo")
+
     def __init__(self, empresa, logo_path=None, numero=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logo_path = logo_path
         self.empresa = empresa
         self.numero = numero
+        # Los bytes del logo se comparten entre cotizaciones sucesivas
+        self._logo = None
+        if logo_path:
+            try:
+                self._logo = leer_logo(logo_path)
+            except Exception:
+                pass
 
     def header(self):
-        if self.logo_path:
+        if self._logo:
             try:
-                self.image(self.logo_path, x=10, y=8, w=30)
+                self.image(io.BytesIO(self._logo), x=10, y=8, w=30)
             except Exception:
                 pass
 
@@ -209,6 +642,8 @@ class CotizadorApp(tk.Tk):
         self._simbolo_moneda_cache = "S/"  # Cache del símbolo de moneda
         self.carpeta_cotizaciones = ""  # Ruta personalizada (vacío = usar predeterminada)
         self.carpeta_referencias = ""   # Ruta personalizada (vacío = usar predeterminada)
+        # Directorio base resuelto una sola vez (resolve() consulta el disco)
+        self.base_dir = get_base_dir()
         # Términos y condiciones predeterminados
         self.terminos_predeterminados = {
             "texto": "",
@@ -221,22 +656,35 @@ class CotizadorApp(tk.Tk):
             "usuario": "",
             "password": "",
             "usar_tls": True,
+            "reutilizar_conexion": True,  # Mantener la sesión SMTP abierta entre envíos
         }
+        # Conexión SMTP reutilizada entre envíos (se evita TLS + login por correo)
+        self._smtp = None
+        self._smtp_key = None
 
         # cache clientes
         self.clientes_hist = {}
+        # Nombres de clientes ordenados por su versión en minúsculas (listas paralelas)
+        # para buscar prefijos con bisect
+        self._clientes_lc_ordenados = []
+        self._clientes_orig_ordenados = []
         self.cliente_seleccionado = None  # Para proteger contra borrado
         
         # Control de versiones
         self.numero_base_version = None  # Guarda el número base al cargar desde historial
+        self._versiones_max = None  # {numero_base: última versión}, se arma al primer uso
 
         # imágenes por ítem
         self.item_images = {}           # {iid: ruta_origen}
+        self._items = {}                # {iid: ItemRow} en el orden de la tabla (fuente de verdad)
         self.pending_image_path = None  # imagen seleccionada para nuevo ítem
         
         # Autoguardado y debounce
         self._autosave_job = None
         self._search_debounce_job = None
+        self._ac_after_id = None  # Debounce del autocompletado de clientes
+        # Última búsqueda "contiene": (texto, índices en las listas ordenadas)
+        self._ac_contiene = None
         self._plantillas_items = []  # Plantillas de items frecuentes
         
         # Bandera para evitar que placeholders interfieran con carga de datos
@@ -246,10 +694,42 @@ class CotizadorApp(tk.Tk):
         self.preview_photo = None
 
         # Historial de notificaciones
-        self.notification_log = []  # Lista de (timestamp, tipo, mensaje)
-
+        # (timestamp, tipo, mensaje); deque con maxlen descarta el más antiguo en O(1)
+        self.notification_log = deque(maxlen=100)
+
+        # Guardado de JSON (configuración, borrador) en segundo plano: la UI
+        # encola (ruta, datos, sincronizar) y el hilo escribe solo la última
+        # versión pendiente de cada archivo
+        self._io_queue = queue.Queue()
+        threading.Thread(target=self._io_worker, daemon=True).start()
+
+        # Escritura de PDFs fuera del hilo de Tk (un trabajo a la vez)
+        self._pdf_pool = ThreadPoolExecutor(max_workers=1)
+        # Envío de correos fuera del hilo de Tk; un solo worker porque la
+        # conexión SMTP reutilizable (self._smtp) no se comparte entre hilos
+        self._smtp_pool = ThreadPoolExecutor(max_workers=1)
+        # Conversión de imágenes de referencia fuera del hilo de Tk
+        self._img_pool = ThreadPoolExecutor(max_workers=1)
+        # Trabajo vacío que marca el fin de cada pool al cerrar (None = app abierta)
+        self._fin_pools = None
+        self._imagenes_pendientes = set()
+        self._contador_imagenes = itertools.count(1)
+        # Vista previa ya decodificada: {(ruta, mtime_ns): PhotoImage}
+        self._miniaturas = {}
+
+        migrar_historial_legacy()
         self._load_config()
 
+        # Imágenes temporales huérfanas de sesiones anteriores (p. ej. cerradas
+        # a mitad de una edición); se limpian en el worker, sin demorar el arranque
+        borrador = load_json_safe(self.base_dir / "borrador_cotizacion.json", {})
+        en_borrador = []
+        if isinstance(borrador, dict):
+            en_borrador = [it.get("imagen") for it in borrador.get("items", [])
+                           if isinstance(it, dict) and it.get("imagen")]
+        self._img_pool.submit(limpiar_imagenes_temporales, self.base_dir / "Referencias",
+                              86400, en_borrador)
+
         # Encabezado cliente
         self.var_cliente = tk.StringVar()
         self.var_direccion = tk.StringVar()
@@ -266,6 +746,8 @@ class CotizadorApp(tk.Tk):
         self.var_subtotal = tk.StringVar(value="S/ 0.00")
         self.var_igv = tk.StringVar(value="S/ 0.00")
         self.var_total = tk.StringVar(value="S/ 0.00")
+        # Copia en Python de lo mostrado en subtotal/IGV/total (evita leer las variables Tcl)
+        self._textos_totales = ["S/ 0.00", "S/ 0.00", "S/ 0.00"]
         self.var_igv_enabled = tk.BooleanVar(value=True)
 
         # Ítems
@@ -292,8 +774,58 @@ class CotizadorApp(tk.Tk):
         # Agregar binding de validación RUC DESPUÉS de los placeholders para que no sea sobrescrito
         self.ent_cliente_ruc.bind("<FocusOut>", self._validar_ruc_cliente, add="+")
 
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _on_close(self):
+        """
+        Cierra la app después de terminar el guardado, los PDF, correos e imágenes pendientes.
+        El hilo de Tk no se bloquea esperando a los workers: sus callbacks llaman a
+        self.after, que necesita este hilo libre para completarse.
+        """
+        if self._fin_pools is not None:
+            return  # Ya se está cerrando
+        # Cada pool tiene un solo worker y atiende en orden: un trabajo vacío al
+        # final termina recién cuando terminó (con su callback) todo lo anterior
+        self._fin_pools = {pool: pool.submit(lambda: None)
+                           for pool in (self._pdf_pool, self._smtp_pool, self._img_pool)}
+        self._esperar_pools_y_cerrar()
+
+    def _esperar_pools_y_cerrar(self, avisar=True, confirmado=False):
+        """Sondea con after() hasta que los pools quedan libres y recién ahí cierra."""
+        if not all(f.done() for f in self._fin_pools.values()):
+            if avisar:
+                self.show_info("Terminando trabajos pendientes antes de cerrar...")
+            self.after(100, self._esperar_pools_y_cerrar, False)
+            return
+        if not confirmado:
+            # Los callbacks que los workers ya dejaron con after() corren antes que
+            # esta vuelta; si encolan más trabajo (p. ej. el correo tras el PDF),
+            # _encolar renueva la marca y se sigue esperando
+            self.after(0, self._esperar_pools_y_cerrar, False, True)
+            return
+        self._io_queue.join()
+        self._pdf_pool.shutdown(wait=True)  # Ya sin trabajos: vuelve de inmediato
+        self._smtp_pool.shutdown(wait=True)
+        self._img_pool.shutdown(wait=True)
+        self._cerrar_smtp()  # El worker SMTP ya no usa la conexión
+        self.destroy()
+
+    def _encolar(self, pool, fn, *args):
+        """
+        Envía fn(*args) al pool. Si la app se está cerrando, pone una marca de fin
+        nueva detrás del trabajo para que el cierre también lo espere.
+        """
+        fut = pool.submit(fn, *args)
+        if self._fin_pools is not None:
+            self._fin_pools[pool] = pool.submit(lambda: None)
+        return fut
+
     # ==== CONFIG FILE ==================================================
     def _load_config(self):
+        # El correlativo vive en su propio archivo; se toma el mayor de ambos
+        # por si la configuración es de una versión anterior
+        self.correlativo = max(self.correlativo, load_correlativo())
+
         data = load_json_safe(CONFIG_PATH, {})
         if not data:
             return
@@ -310,7 +842,7 @@ class CotizadorApp(tk.Tk):
 
         self.serie = data.get("serie", self.serie)
         try:
-            self.correlativo = int(data.get("correlativo", self.correlativo))
+            self.correlativo = max(self.correlativo, int(data.get("correlativo", 1)))
         except ValueError:
             pass
         
@@ -334,7 +866,26 @@ class CotizadorApp(tk.Tk):
             "terminos_predeterminados": self.terminos_predeterminados,
             "email_config": self.email_config,
         }
-        save_json_safe(CONFIG_PATH, data)
+        # Se encola una copia: el hilo no debe leer dicts que la UI sigue modificando
+        self._io_queue.put((CONFIG_PATH, copy.deepcopy(data), True))
+
+    def _io_worker(self):
+        """Hilo que escribe en disco los JSON encolados en self._io_queue."""
+        while True:
+            trabajos = [self._io_queue.get()]
+            # Juntar lo que se acumuló mientras tanto: por archivo gana la última versión
+            while True:
+                try:
+                    trabajos.append(self._io_queue.get_nowait())
+                except queue.Empty:
+                    break
+            ultimos = {path: (data, sincronizar) for path, data, sincronizar in trabajos}
+            try:
+                for path, (data, sincronizar) in ultimos.items():
+                    save_json_safe(path, data, sincronizar=sincronizar)
+            finally:
+                for _ in trabajos:
+                    self._io_queue.task_done()
 
     # ==== SMALL HELPERS ===============================================
     def _clean_var(self, var: tk.StringVar, placeholder: str) -> str:
@@ -353,13 +904,13 @@ class CotizadorApp(tk.Tk):
         """Obtiene la carpeta de cotizaciones (personalizada o predeterminada)."""
         if self.carpeta_cotizaciones and Path(self.carpeta_cotizaciones).exists():
             return Path(self.carpeta_cotizaciones)
-        return get_base_dir() / "Cotizaciones"
+        return self.base_dir / "Cotizaciones"
     
     def _get_referencias_dir(self) -> Path:
         """Obtiene la carpeta de referencias (personalizada o predeterminada)."""
         if self.carpeta_referencias and Path(self.carpeta_referencias).exists():
             return Path(self.carpeta_referencias)
-        return get_base_dir() / "Referencias"
+        return self.base_dir / "Referencias"
 
     # ==== UI ROOT ======================================================
     def _build_ui(self):
@@ -462,6 +1013,8 @@ class CotizadorApp(tk.Tk):
         self.tree.column("cant", width=80, anchor="e")
         self.tree.column("precio", width=110, anchor="e")
         self.tree.column("subtotal", width=130, anchor="e")
+        # Resaltado de la fila en edición (se configura una sola vez)
+        self.tree.tag_configure("edit", background="#FFF3CD")
 
         scroll_tree = ttk.Scrollbar(left, orient="vertical", command=self.tree.yview)
         self.tree.configure(yscrollcommand=scroll_tree.set)
@@ -496,6 +1049,12 @@ class CotizadorApp(tk.Tk):
         self.ent_precio = ttk.Entry(frm, textvariable=self.var_precio, width=12)
         self.ent_precio.grid(row=0, column=2, padx=2)
 
+        # Rechazar texto no numérico al teclear en lugar de validar recién en agregar_item
+        vcmd_cant = (self.register(self._validar_cantidad_parcial), "%P")
+        vcmd = (self.register(self._validar_numero_parcial), "%P")
+        self.ent_cant.configure(validate="key", validatecommand=vcmd_cant)
+        self.ent_precio.configure(validate="key", validatecommand=vcmd)
+
         # Enter en Cant/Precio -> agregar ítem
         self.ent_cant.bind("<Return>", self._smart_enter)
         self.ent_precio.bind("<Return>", self._smart_enter)
@@ -587,16 +1146,23 @@ class CotizadorApp(tk.Tk):
         ttk.Button(frm, text="Abrir carpeta de cotizaciones",
                    command=self.abrir_carpeta_cotizaciones).pack(side="left", padx=5)
 
-        ttk.Button(frm, text="Enviar por correo", command=self.enviar_por_correo).pack(
-            side="right"
-        )
-        ttk.Button(frm, text="Generar PDF", command=self.generar_pdf).pack(side="right", padx=5)
+        self.btn_enviar_correo = ttk.Button(frm, text="Enviar por correo", command=self.enviar_por_correo)
+        self.btn_enviar_correo.pack(side="right")
+        self.btn_generar_pdf = ttk.Button(frm, text="Generar PDF", command=self.generar_pdf)
+        self.btn_generar_pdf.pack(side="right", padx=5)
+        self.pb_pdf = ttk.Progressbar(frm, mode="indeterminate", length=120)
         
-        # Barra de estado (clickeable) con texto en negrita
-        # Usar tk.Label en lugar de ttk.Label para poder aplicar fuente en negrita
-        self.status_bar = tk.Label(self, text="Listo", relief="sunken", anchor="w", 
-                                   background="#f0f0f0", foreground="#555555",
-                                   font=("Arial", 9, "bold"), padx=5, pady=3)
+        # Barra de estado (clickeable) con texto en negrita. Un estilo ttk por
+        # tipo de mensaje y tono: cada paso del parpadeo es un solo cambio de style
+        style = ttk.Style(self)
+        style.configure("Status.TLabel", background="#f0f0f0", foreground="#555555",
+                        font=("Arial", 9, "bold"), relief="sunken", padding=(5, 3))
+        for tipo, ((bg, fg), (bg_atenuado, fg_atenuado)) in COLORES_ESTADO.items():
+            # "<tipo>.Status.TLabel" hereda fuente, borde y relleno de Status.TLabel
+            style.configure(f"{tipo}.Status.TLabel", background=bg, foreground=fg)
+            style.configure(f"{tipo}Atenuado.Status.TLabel", background=bg_atenuado,
+                            foreground=fg_atenuado)
+        self.status_bar = ttk.Label(self, text="Listo", style="Status.TLabel", anchor="w")
         self.status_bar.pack(side="bottom", fill="x", padx=2, pady=2)
         self.status_bar.bind("<Button-1>", lambda e: self.abrir_log_notificaciones())
 
@@ -608,42 +1174,25 @@ class CotizadorApp(tk.Tk):
         duracion: tiempo en milisegundos antes de volver a 'Listo' (0 = permanente)
         """
         from datetime import datetime
-        colores = {
-            "success": ("#d4edda", "#155724"),    # Verde claro fondo, verde oscuro texto
-            "error": ("#f8d7da", "#721c24"),      # Rojo claro fondo, rojo oscuro texto
-            "warning": ("#fff3cd", "#856404"),    # Amarillo claro fondo, naranja texto
-            "info": ("#cce5ff", "#0052cc")        # Azul claro fondo, azul oscuro texto (MÁS LLAMATIVO)
-        }
-        bg, fg = colores.get(tipo, colores["info"])
-        
-        # Colores atenuados para el efecto de parpadeo (off)
-        colores_atenuados = {
-            "success": ("#e8f5e9", "#4caf50"),    # Verde muy claro, verde más suave
-            "error": ("#ffebee", "#ef5350"),      # Rojo muy claro, rojo más suave
-            "warning": ("#fffde7", "#fbc02d"),    # Amarillo muy claro, amarillo más suave
-            "info": ("#e3f2fd", "#90caf9")        # Azul muy claro, azul más suave
-        }
-        bg_atenuado, fg_atenuado = colores_atenuados.get(tipo, colores_atenuados["info"])
+        # Estilos creados en _build_actions a partir de COLORES_ESTADO
+        tipo_estilo = tipo if tipo in COLORES_ESTADO else "info"
+        estilo = f"{tipo_estilo}.Status.TLabel"
+        estilo_atenuado = f"{tipo_estilo}Atenuado.Status.TLabel"
         
         # Guardar en el historial de notificaciones
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.notification_log.append((timestamp, tipo, message))
-        # Mantener solo los últimos 100 mensajes
-        if len(self.notification_log) > 100:
-            self.notification_log.pop(0)
+        self.notification_log.append((timestamp, tipo, message))  # Solo los últimos 100
         
         # Cancelar parpadeo anterior si existe
         if hasattr(self, '_blink_job') and self._blink_job:
             self.after_cancel(self._blink_job)
         
-        # Mostrar el mensaje con efecto de parpadeo
+        # Mostrar el mensaje con efecto de parpadeo: el texto se fija una vez
+        # y cada paso solo cambia el estilo
+        self.status_bar.config(text=message)
+        # Alterna normal/atenuado y termina en el estilo normal
+        self._blink_frames = [estilo, estilo_atenuado] * 3 + [estilo]
         self._blink_count = 0
-        self._blink_max = 8  # 8 parpadeos (on/off) para más visibilidad
-        self._blink_message = message
-        self._blink_bg = bg
-        self._blink_fg = fg
-        self._blink_bg_atenuado = bg_atenuado
-        self._blink_fg_atenuado = fg_atenuado
         self._blink_timer_duration = duracion
         
         # Iniciar el parpadeo
@@ -651,33 +1200,18 @@ class CotizadorApp(tk.Tk):
     
     def _do_blink(self):
         """Realiza el efecto de parpadeo en la barra de estado."""
-        # Alternar entre visible e invisible
-        if self._blink_count % 2 == 0:
-            # Mostrar el mensaje con colores originales
-            self.status_bar.config(text=self._blink_message, 
-                                  background=self._blink_bg, 
-                                  foreground=self._blink_fg)
-        else:
-            # Mostrar un estado atenuado pero aún visible
-            self.status_bar.config(text=self._blink_message, 
-                                  background=self._blink_bg_atenuado, 
-                                  foreground=self._blink_fg_atenuado)
-        
+        self.status_bar.config(style=self._blink_frames[self._blink_count])
         self._blink_count += 1
         
         # Si aún hay parpadeos pendientes
-        if self._blink_count < self._blink_max:
+        if self._blink_count < len(self._blink_frames):
             # Esperar 250ms entre parpadeos
             self._blink_job = self.after(250, self._do_blink)
         else:
-            # Cuando termina el parpadeo, mostrar el mensaje permanentemente por duracion
-            self.status_bar.config(text=self._blink_message, 
-                                  background=self._blink_bg, 
-                                  foreground=self._blink_fg)
-            
+            # Cuando termina el parpadeo, el mensaje queda visible por duracion
             if self._blink_timer_duration > 0:
                 self._blink_job = self.after(self._blink_timer_duration, lambda: self.status_bar.config(
-                    text="Listo", background="#f0f0f0", foreground="#555555"
+                    text="Listo", style="Status.TLabel"
                 ))
     
     
@@ -759,43 +1293,52 @@ class CotizadorApp(tk.Tk):
         var.set(placeholder)
         entry.configure(foreground="grey")
 
-        def on_focus_in(event, e=entry, v=var, ph=placeholder):
-            if self._loading_data:  # No interferir si estamos cargando datos
-                return
-            if v.get() == ph:
-                v.set("")
-                e.configure(foreground="black")
+        # Los datos del placeholder viajan en el widget: un mismo handler sirve
+        # para todas las entradas, sin una closure por widget
+        entry._ph_text = placeholder
+        entry._ph_var = var
+        entry.bind("<FocusIn>", self._entry_focus_in)
+        entry.bind("<FocusOut>", self._entry_focus_out)
 
-        def on_focus_out(event, e=entry, v=var, ph=placeholder):
-            if self._loading_data:  # No interferir si estamos cargando datos
-                return
-            if not v.get().strip():
-                v.set(ph)
-                e.configure(foreground="grey")
+    def _entry_focus_in(self, event):
+        if self._loading_data:  # No interferir si estamos cargando datos
+            return
+        e = event.widget
+        if e._ph_var.get() == e._ph_text:
+            e._ph_var.set("")
+            e.configure(foreground="black")
 
-        entry.bind("<FocusIn>", on_focus_in)
-        entry.bind("<FocusOut>", on_focus_out)
+    def _entry_focus_out(self, event):
+        if self._loading_data:  # No interferir si estamos cargando datos
+            return
+        e = event.widget
+        if not e._ph_var.get().strip():
+            e._ph_var.set(e._ph_text)
+            e.configure(foreground="grey")
 
     def _init_text_placeholder(self, widget, placeholder):
         widget.insert("1.0", placeholder)
         widget.configure(foreground="grey")
 
-        def on_focus_in(event, w=widget, ph=placeholder):
-            if self._loading_data:  # No interferir si estamos cargando datos
-                return
-            if w.get("1.0", "end").strip() == ph and str(w.cget("foreground")) == "grey":
-                w.delete("1.0", "end")
-                w.configure(foreground="black")
+        widget._ph_text = placeholder
+        widget.bind("<FocusIn>", self._text_focus_in)
+        widget.bind("<FocusOut>", self._text_focus_out)
 
-        def on_focus_out(event, w=widget, ph=placeholder):
-            if self._loading_data:  # No interferir si estamos cargando datos
-                return
-            if not w.get("1.0", "end").strip():
-                w.insert("1.0", ph)
-                w.configure(foreground="grey")
+    def _text_focus_in(self, event):
+        if self._loading_data:  # No interferir si estamos cargando datos
+            return
+        w = event.widget
+        if w.get("1.0", "end").strip() == w._ph_text and str(w.cget("foreground")) == "grey":
+            w.delete("1.0", "end")
+            w.configure(foreground="black")
 
-        widget.bind("<FocusIn>", on_focus_in)
-        widget.bind("<FocusOut>", on_focus_out)
+    def _text_focus_out(self, event):
+        if self._loading_data:  # No interferir si estamos cargando datos
+            return
+        w = event.widget
+        if not w.get("1.0", "end").strip():
+            w.insert("1.0", w._ph_text)
+            w.configure(foreground="grey")
 
     def _reset_text_placeholder(self, widget, placeholder):
         widget.delete("1.0", "end")
@@ -877,6 +1420,7 @@ class CotizadorApp(tk.Tk):
         var_user = tk.StringVar(value=self.email_config.get("usuario", ""))
         var_pass = tk.StringVar(value=self.email_config.get("password", ""))
         var_tls = tk.BooleanVar(value=self.email_config.get("usar_tls", True))
+        var_reusar = tk.BooleanVar(value=self.email_config.get("reutilizar_conexion", True))
 
         ttk.Label(frm_mail, text="Servidor SMTP:").grid(row=0, column=0, sticky="w", padx=5, pady=5)
         ttk.Entry(frm_mail, textvariable=var_srv, width=30).grid(row=0, column=1, padx=5, pady=5)
@@ -893,6 +1437,9 @@ class CotizadorApp(tk.Tk):
         ttk.Checkbutton(frm_mail, text="Usar TLS", variable=var_tls).grid(
             row=4, column=0, columnspan=2, sticky="w", padx=5, pady=5
         )
+        ttk.Checkbutton(
+            frm_mail, text="Mantener conexión abierta entre envíos", variable=var_reusar
+        ).grid(row=5, column=0, columnspan=2, sticky="w", padx=5, pady=5)
 
         # Pestaña Totales
         frm_tot = ttk.Frame(nb)
@@ -991,10 +1538,14 @@ class CotizadorApp(tk.Tk):
                 return
 
             if messagebox.askyesno("Confirmar", "¿Deseas restaurar la aplicación de fábrica?"):
+                # Evitar que un guardado pendiente vuelva a crear la configuración
+                self._io_queue.join()
                 try:
-                    base_dir = get_base_dir()
+                    base_dir = self.base_dir
                     # Eliminar archivos de configuración y datos del usuario
-                    for file in ["config_cotizador.json", "historial_cotizaciones.json", "catalog.json", 
+                    for file in ["config_cotizador.json", "correlativo_cotizador.txt",
+                                 "historial_cotizaciones.json",
+                                 "historial_cotizaciones.jsonl", "catalog.json",
                                  "plantillas_items.json", "borrador_cotizacion.json"]:
                         f = Path(file)
                         if f.exists():
@@ -1074,6 +1625,7 @@ class CotizadorApp(tk.Tk):
             self.email_config["usuario"] = var_user.get().strip()
             self.email_config["password"] = var_pass.get().strip()
             self.email_config["usar_tls"] = var_tls.get()
+            self.email_config["reutilizar_conexion"] = var_reusar.get()
 
             self._save_config()
             
@@ -1107,30 +1659,19 @@ class CotizadorApp(tk.Tk):
             # Extraer el número base sin versión
             numero_base = self.numero_base_version
             
-            # Buscar todas las versiones existentes de este número en el historial
-            hist_data = load_json_safe(HIST_PATH, [])
-            versiones_existentes = []
+            # Última versión de cada número: se recorre el historial una sola vez
+            # y luego se mantiene en memoria al reservar cada nueva versión
+            if self._versiones_max is None:
+                self._versiones_max = {}
+                for r in load_historial():
+                    # Sin versión explícita = V1
+                    base, version = parse_numero_version(r.get("numero", ""))
+                    if version > self._versiones_max.get(base, 0):
+                        self._versiones_max[base] = version
             
-            for r in hist_data:
-                num = r.get("numero", "")
-                # Verificar si el número coincide con el base
-                if num.startswith(numero_base):
-                    # Extraer versión si existe
-                    if "-V" in num:
-                        try:
-                            version = int(num.split("-V")[1])
-                            versiones_existentes.append(version)
-                        except (IndexError, ValueError):
-                            pass
-                    else:
-                        # Sin versión explícita = V1
-                        versiones_existentes.append(1)
-            
-            # Determinar la siguiente versión
-            if versiones_existentes:
-                siguiente_version = max(versiones_existentes) + 1
-            else:
-                siguiente_version = 2  # Si no hay versiones, esta es la V2
+            # Determinar la siguiente versión (si no hay versiones, esta es la V2)
+            siguiente_version = self._versiones_max.get(numero_base, 1) + 1
+            self._versiones_max[numero_base] = siguiente_version
             
             numero = f"{numero_base}-V{siguiente_version}"
             # Limpiar el numero_base_version después de usarlo
@@ -1139,7 +1680,8 @@ class CotizadorApp(tk.Tk):
             # Cotización nueva normal (sin versión explícita)
             numero = f"{self.serie}-{str(self.correlativo).zfill(5)}"
             self.correlativo += 1
-            self._save_config()
+            # Solo cambia el correlativo: no hace falta reescribir toda la configuración
+            save_correlativo(self.correlativo)
         
         self._actualizar_numero_cot_display()
         return numero
@@ -1162,24 +1704,22 @@ class CotizadorApp(tk.Tk):
         if not path:
             return
 
-        base_dir = get_base_dir()
-        ref_dir = base_dir / "Referencias"
+        ref_dir = self.base_dir / "Referencias"
         ref_dir.mkdir(exist_ok=True)
 
-        png_name = f"TMP_{uuid.uuid4().hex}.png"
+        # PID + contador: único dentro de la sesión sin pedir bytes aleatorios;
+        # uuid solo si quedó un temporal de otra sesión con el mismo nombre
+        png_name = f"TMP_{os.getpid()}_{next(self._contador_imagenes):06d}.png"
         ref_path = ref_dir / png_name
+        if ref_path.exists():
+            import uuid
+            ref_path = ref_dir / f"TMP_{uuid.uuid4().hex}.png"
 
-        try:
-            from PIL import Image
-            im = Image.open(path)
-            im = im.convert("RGB")
-            im.save(ref_path, format="PNG")
-        except Exception as e:
-            try:
-                shutil.copyfile(path, ref_path)
-            except Exception as e2:
-                self.show_error(f"No se pudo preparar la imagen: {str(e)[:50]}")
-                return
+        # La conversión a PNG corre en el worker; la ruta se asocia desde ya
+        # y _on_imagen_lista solo interviene si la conversión falla
+        fut = self._encolar(self._img_pool, self._convertir_imagen, path, ref_path)
+        self._imagenes_pendientes.add(fut)
+        fut.add_done_callback(lambda f: self.after(0, self._on_imagen_lista, f, str(ref_path)))
 
         if self.item_editing:
             old_path = self.item_images.get(self.item_editing)
@@ -1192,15 +1732,72 @@ class CotizadorApp(tk.Tk):
                     pass
 
             self.item_images[self.item_editing] = str(ref_path)
-            vals = list(self.tree.item(self.item_editing, "values"))
-            if vals:
-                vals[0] = "📷"
-                self.tree.item(self.item_editing, values=vals)
+            # Solo cambia la columna del icono: una llamada Tcl
+            self.tree.set(self.item_editing, "img", "📷")
         else:
             self.pending_image_path = str(ref_path)
 
         self.show_success("Imagen asociada al ítem.")
 
+    @staticmethod
+    def _convertir_imagen(origen, destino):
+        """
+        Guarda la imagen como PNG en `destino` (corre en el worker, no toca Tk).
+        Retorna (error, miniatura): error es None si se pudo preparar; miniatura
+        es (mtime_ns, imagen reducida para la vista previa) o None.
+        """
+        try:
+            from PIL import Image
+            with Image.open(origen) as im:
+                rgb = im.convert("RGB")
+            rgb.save(destino, format="PNG")
+            # La miniatura sale de la imagen ya decodificada, sin releer el PNG
+            rgb.thumbnail((220, 160), getattr(Image, "Resampling", Image).BILINEAR)
+            return None, (os.stat(destino).st_mtime_ns, rgb)
+        except Exception as e:
+            try:
+                shutil.copyfile(origen, destino)
+            except Exception:
+                return f"No se pudo preparar la imagen: {str(e)[:50]}", None
+        return None, None
+
+    def _on_imagen_lista(self, fut, ref_path):
+        self._imagenes_pendientes.discard(fut)
+        error, miniatura = fut.result()
+        asociados = [iid for iid, p in self.item_images.items() if p == ref_path]
+
+        if error:
+            self.show_error(error)
+            if self.pending_image_path == ref_path:
+                self.pending_image_path = None
+            for iid in asociados:
+                del self.item_images[iid]
+                if self.tree.exists(iid):
+                    self.tree.set(iid, "img", "")
+            return
+
+        if not asociados and self.pending_image_path != ref_path:
+            # El ítem se eliminó o cambió de imagen mientras se convertía
+            try:
+                Path(ref_path).unlink()
+            except Exception:
+                pass
+            return
+
+        if miniatura is not None:
+            try:
+                from PIL import ImageTk
+                if len(self._miniaturas) >= MAX_MINIATURAS:
+                    self._miniaturas.clear()
+                mtime, im = miniatura
+                self._miniaturas[(ref_path, mtime)] = ImageTk.PhotoImage(im)
+            except Exception:
+                pass
+
+        sel = self.tree.selection()
+        if sel and sel[0] in asociados:
+            self._on_tree_select(None)
+
     def agregar_item(self):
         desc = self.txt_desc.get("1.0", "end").strip()
         if desc == self.placeholder_desc:
@@ -1209,30 +1806,28 @@ class CotizadorApp(tk.Tk):
             self.show_warning("La descripción no puede estar vacía.")
             return
 
-        try:
-            cant = float(self.var_cant.get())
-            precio = float(self.var_precio.get())
-        except ValueError:
+        cant_txt = self.var_cant.get().strip()
+        precio_txt = self.var_precio.get().strip()
+        if not (NUMERO_PATTERN.fullmatch(cant_txt) and NUMERO_PATTERN.fullmatch(precio_txt)):
             self.show_warning("Cantidad o precio inválidos.")
             return
 
-        subtotal = cant * precio
-        
-        # Reemplazar saltos de línea por " | " para visualización en tabla
-        desc_display = desc.replace('\n', ' | ')
+        # Aritmética entera (milésimas y centavos): sin errores de redondeo de float
+        cant_m = a_milesimas(cant_txt)
+        precio_c = a_centavos(precio_txt)
+        subtotal_c = multiplicar_centavos(cant_m, precio_c)
 
         if self.item_editing:
+            # Reasignar la clave conserva la posición del ítem en el dict
+            row = ItemRow(desc, cant_m, precio_c, subtotal_c, self.item_editing)
+            self._items[self.item_editing] = row
             icon = "📷" if self.item_images.get(self.item_editing) else ""
-            self.tree.item(
-                self.item_editing,
-                values=(icon, desc_display, f"{cant:.2f}", f"{precio:.2f}", f"{subtotal:.2f}")
-            )
+            self.tree.item(self.item_editing, values=self._valores_fila(row, icon))
         else:
+            row = ItemRow(desc, cant_m, precio_c, subtotal_c, None)
             icon = "📷" if self.pending_image_path else ""
-            iid = self.tree.insert(
-                "", "end",
-                values=(icon, desc_display, f"{cant:.2f}", f"{precio:.2f}", f"{subtotal:.2f}")
-            )
+            iid = self.tree.insert("", "end", values=self._valores_fila(row, icon))
+            self._items[iid] = row._replace(iid=iid)
             if self.pending_image_path:
                 self.item_images[iid] = self.pending_image_path
                 self.pending_image_path = None
@@ -1240,6 +1835,33 @@ class CotizadorApp(tk.Tk):
         self._reset_form()
         self._refresh_totals()
 
+    @contextmanager
+    def _tree_batch(self, tree=None):
+        """
+        Agrupa muchas inserciones/movimientos en una Treeview: sin columnas
+        visibles no recalcula su layout por fila y se redibuja una sola vez al
+        salir. No vale la pena para operaciones de un solo ítem.
+        """
+        tree = tree or self.tree
+        previas = tree.cget("displaycolumns")
+        tree.configure(displaycolumns=())
+        try:
+            yield tree
+        finally:
+            tree.configure(displaycolumns=previas)
+
+    @staticmethod
+    def _valores_fila(row, icon=""):
+        """Valores a mostrar en la Treeview para un ItemRow."""
+        # Reemplazar saltos de línea por " | " para visualización en tabla
+        return (
+            icon,
+            row.desc.replace('\n', ' | '),
+            formatear_cantidad(row.cant_m),
+            formatear_centavos(row.precio_c),
+            formatear_centavos(row.sub_c),
+        )
+
     def editar_item(self):
         sel = self.tree.selection()
         if not sel:
@@ -1247,10 +1869,10 @@ class CotizadorApp(tk.Tk):
             return
 
         item = sel[0]
-        vals = self.tree.item(item)["values"]
-        desc = vals[1]
-        cant = vals[2]
-        precio = vals[3]
+        row = self._items[item]
+        desc = row.desc
+        cant = formatear_cantidad(row.cant_m)
+        precio = formatear_centavos(row.precio_c)
 
         self._reset_text_placeholder(self.txt_desc, self.placeholder_desc)
         self.txt_desc.delete("1.0", "end")
@@ -1265,7 +1887,6 @@ class CotizadorApp(tk.Tk):
         self.item_editing = item
         self.btn_add["text"] = "Guardar"
         self.btn_cancel["state"] = "normal"
-        self.tree.tag_configure("edit", background="#FFF3CD")
         self.tree.item(item, tags=("edit",))
 
         self.pending_image_path = None
@@ -1285,6 +1906,7 @@ class CotizadorApp(tk.Tk):
 
         img_path = self.item_images.pop(iid, None)
         if img_path:
+            self._miniaturas = {k: v for k, v in self._miniaturas.items() if k[0] != img_path}
             try:
                 p = Path(img_path)
                 if p.exists():
@@ -1296,6 +1918,7 @@ class CotizadorApp(tk.Tk):
             self.item_editing = None
 
         self.tree.delete(iid)
+        self._items.pop(iid, None)
 
         self._reset_form()
         self._refresh_totals()
@@ -1323,22 +1946,46 @@ class CotizadorApp(tk.Tk):
         self.item_editing = None
         self.pending_image_path = None
 
-    def _refresh_totals(self):
-        items = self.tree.get_children()
-        subtotales = [
-            float(self.tree.item(i)["values"][4]) for i in items
-        ] if items else []
-        subtotal = sum(subtotales)
+    def _validar_numero_parcial(self, nuevo):
+        """validatecommand de precio: acepta vacío, placeholder o número a medio escribir."""
+        if nuevo in ("", self.placeholder_precio):
+            return True
+        return NUMERO_PARCIAL_PATTERN.fullmatch(nuevo) is not None
+
+    def _validar_cantidad_parcial(self, nuevo):
+        """validatecommand de cantidad: como el de precio, pero con hasta 3 decimales."""
+        if nuevo in ("", self.placeholder_cant):
+            return True
+        return CANTIDAD_PARCIAL_PATTERN.fullmatch(nuevo) is not None
+
+    def _calcular_totales_c(self):
+        """Retorna (subtotal, igv, total) en centavos enteros."""
+        # Los ítems se mantienen en memoria al agregar/editar/eliminar,
+        # así no se consulta el Treeview (una llamada Tcl por fila) en cada cambio
+        subtotal_c = sum(row.sub_c for row in self._items.values())
+        igv_c = 0
+        if self.var_igv_enabled.get():
+            igv_c = int((subtotal_c * Decimal(str(self.tasa_igv))).quantize(
+                Decimal(1), rounding=ROUND_HALF_UP))
+        return subtotal_c, igv_c, subtotal_c + igv_c
 
-        igv = subtotal * self.tasa_igv if self.var_igv_enabled.get() else 0.0
-        total = subtotal + igv
+    def _refresh_totals(self):
+        subtotal_c, igv_c, total_c = self._calcular_totales_c()
 
         # Obtener símbolo de moneda
         simbolo = self._get_simbolo_moneda()
         
-        self.var_subtotal.set(f"{simbolo} {subtotal:,.2f}")
-        self.var_igv.set(f"{simbolo} {igv:,.2f}")
-        self.var_total.set(f"{simbolo} {total:,.2f}")
+        # set() dispara los traces aunque el valor no cambie: solo se llama si
+        # cambió, comparando con la copia en Python en vez de hacer var.get()
+        for i, (var, centavos) in enumerate((
+            (self.var_subtotal, subtotal_c),
+            (self.var_igv, igv_c),
+            (self.var_total, total_c),
+        )):
+            texto = formatear_monto(simbolo, centavos)
+            if self._textos_totales[i] != texto:
+                self._textos_totales[i] = texto
+                var.set(texto)
         
         # Activar autoguardado cada vez que cambian los totales
         self._programar_autoguardado()
@@ -1358,7 +2005,7 @@ class CotizadorApp(tk.Tk):
         """Guarda un borrador temporal de la cotización actual."""
         try:
             # Solo guardar si hay items o datos del cliente
-            if not self.tree.get_children() and not self.var_cliente.get().strip():
+            if not self._items and not self.var_cliente.get().strip():
                 return
             
             borrador = {
@@ -1375,20 +2022,19 @@ class CotizadorApp(tk.Tk):
                 "items": []
             }
             
-            # Guardar items
-            for item_id in self.tree.get_children():
-                vals = self.tree.item(item_id)["values"]
+            # Guardar items (desde el modelo en memoria, sin consultar el Treeview)
+            for row in self._items.values():
                 borrador["items"].append({
-                    "descripcion": vals[1],
-                    "cantidad": vals[2],
-                    "precio": vals[3],
-                    "subtotal": vals[4],
-                    "imagen": self.item_images.get(item_id, "")
+                    "descripcion": row.desc,
+                    "cantidad": formatear_cantidad(row.cant_m),
+                    "precio": formatear_centavos(row.precio_c),
+                    "subtotal": formatear_centavos(row.sub_c),
+                    "imagen": self.item_images.get(row.iid, "")
                 })
             
-            # Guardar en archivo temporal
-            borrador_path = get_base_dir() / "borrador_cotizacion.json"
-            save_json_safe(borrador_path, borrador)
+            # El dict se arma nuevo en cada llamada: se escribe en el hilo de E/S
+            borrador_path = self.base_dir / "borrador_cotizacion.json"
+            self._io_queue.put((borrador_path, borrador, False))
             
         except Exception:
             pass  # Silencioso, no interrumpir al usuario
@@ -1402,7 +2048,7 @@ class CotizadorApp(tk.Tk):
         win.grab_set()
         
         # Cargar items únicos del historial de cotizaciones
-        hist_data = load_json_safe(HIST_PATH, [])
+        hist_data = load_historial()
         items_unicos = {}
         
         # Recolectar todos los items de todas las cotizaciones
@@ -1575,10 +2221,20 @@ class CotizadorApp(tk.Tk):
             return
 
         try:
-            im = Image.open(img_src)
-            max_w, max_h = 220, 160
-            im.thumbnail((max_w, max_h))
-            self.preview_photo = ImageTk.PhotoImage(im)
+            # Volver a seleccionar un ítem reutiliza la miniatura ya decodificada
+            clave = (img_src, os.stat(img_src).st_mtime_ns)
+            photo = self._miniaturas.get(clave)
+            if photo is None:
+                with Image.open(img_src) as im:
+                    max_w, max_h = 220, 160
+                    # BILINEAR basta para una vista previa y es bastante más
+                    # rápido que el filtro por defecto (Pillow < 9.1: Image.BILINEAR)
+                    im.thumbnail((max_w, max_h), getattr(Image, "Resampling", Image).BILINEAR)
+                    photo = ImageTk.PhotoImage(im)
+                if len(self._miniaturas) >= MAX_MINIATURAS:
+                    self._miniaturas.clear()
+                self._miniaturas[clave] = photo
+            self.preview_photo = photo
             self.lbl_preview.configure(image=self.preview_photo, text="")
         except Exception:
             self._clear_preview()
@@ -1588,7 +2244,8 @@ class CotizadorApp(tk.Tk):
         self.preview_photo = None
 
     # ==== HISTORIAL / CLIENTES ========================================
-    def _guardar_en_historial(self, numero, ruta_pdf, subtotal, igv, total, estado):
+    def _armar_registro_historial(self, numero, ruta_pdf, subtotal, igv, total, estado):
+        """Arma el registro de historial con el estado actual de la cotización."""
         cliente = self._clean_var(self.var_cliente, self.placeholder_cliente)
         email = self._clean_var(self.var_cliente_email, self.placeholder_email_cliente)
         direccion = self._clean_var(self.var_direccion, self.placeholder_dir_cliente)
@@ -1596,16 +2253,13 @@ class CotizadorApp(tk.Tk):
 
         # Recopilar items con sus imágenes
         items = []
-        for item_id in self.tree.get_children():
-            icon, desc, cant, precio, subtotal_item = self.tree.item(item_id)["values"]
-            # Reemplazar " | " de vuelta a saltos de línea para guardar correctamente en historial
-            desc = desc.replace(' | ', '\n')
-            img_src = self.item_images.get(item_id, "")
+        for row in self._items.values():
+            img_src = self.item_images.get(row.iid, "")
             items.append({
-                "descripcion": desc,
-                "cantidad": cant,
-                "precio": precio,
-                "subtotal": subtotal_item,
+                "descripcion": row.desc,
+                "cantidad": formatear_cantidad(row.cant_m),
+                "precio": formatear_centavos(row.precio_c),
+                "subtotal": formatear_centavos(row.sub_c),
                 "imagen": str(img_src) if img_src else ""
             })
         
@@ -1625,36 +2279,74 @@ class CotizadorApp(tk.Tk):
             "condicion_pago": self.var_condicion_pago.get(),
             "validez": self.var_validez.get(),
             "items": items,
-            "subtotal": float(f"{subtotal:.2f}"),
-            "igv": float(f"{igv:.2f}"),
-            "total": float(f"{total:.2f}"),
+            "subtotal": round(subtotal, 2),
+            "igv": round(igv, 2),
+            "total": round(total, 2),
             "tasa_igv": self.tasa_igv,
             "moneda": self.moneda,
             "igv_enabled": self.var_igv_enabled.get(),
             "ruta_pdf": Path(ruta_pdf).name,  # Guardar solo el nombre del archivo (ruta relativa)
             "estado": estado,
         }
-        data = load_json_safe(HIST_PATH, [])
-        data.append(registro)
-        save_json_safe(HIST_PATH, data)
-
-        self._cargar_clientes_frecuentes_en_combo()
+        return registro
 
     def _cargar_clientes_frecuentes_en_combo(self):
         self.clientes_hist = {}
-        data = load_json_safe(HIST_PATH, [])
-        if not data:
-            self.cmb_clientes["values"] = []
-            return
 
-        for r in data:
+        # load_historial reutiliza lo ya parseado si el archivo no cambió
+        for r in load_historial():
             nombre = r.get("cliente", "").strip()
             if not nombre:
                 continue
             self.clientes_hist[nombre.lower()] = r
 
         nombres = sorted({r["cliente"] for r in self.clientes_hist.values()})
+        self._clientes_combo = nombres
         self.cmb_clientes["values"] = nombres
+        # Se normaliza una sola vez aquí y no en cada tecla del autocompletado
+        pares = sorted((normalizar_busqueda(n), n) for n in nombres)
+        self._clientes_lc_ordenados = [lc for lc, _ in pares]
+        self._clientes_orig_ordenados = [n for _, n in pares]
+        self._ac_contiene = None
+
+    def _agregar_cliente_hist(self, registro):
+        """
+        Actualiza los clientes frecuentes con un registro nuevo sin releer el
+        historial: las listas ordenadas se mantienen con bisect.
+        """
+        nombre = registro.get("cliente", "").strip()
+        if not nombre:
+            return
+        clave = nombre.lower()
+        previo = self.clientes_hist.get(clave)
+        self.clientes_hist[clave] = registro
+        if previo is not None and previo["cliente"] == registro["cliente"]:
+            return  # Mismo nombre: las listas no cambian
+
+        lcs = self._clientes_lc_ordenados
+        origs = self._clientes_orig_ordenados
+        self._ac_contiene = None  # Los índices cambian con la inserción
+        if previo is not None:
+            # Otra grafía del mismo cliente (p. ej. mayúsculas): se reemplaza
+            viejo = previo["cliente"]
+            i = bisect_left(lcs, normalizar_busqueda(viejo))
+            while i < len(lcs) and origs[i] != viejo:
+                i += 1
+            if i < len(lcs):
+                del lcs[i], origs[i]
+            j = bisect_left(self._clientes_combo, viejo)
+            if j < len(self._clientes_combo) and self._clientes_combo[j] == viejo:
+                del self._clientes_combo[j]
+
+        nuevo = registro["cliente"]
+        lc = normalizar_busqueda(nuevo)
+        i = bisect_left(lcs, lc)
+        while i < len(lcs) and lcs[i] == lc and origs[i] < nuevo:
+            i += 1
+        lcs.insert(i, lc)
+        origs.insert(i, nuevo)
+        insort(self._clientes_combo, nuevo)
+        self.cmb_clientes["values"] = self._clientes_combo
 
     def _rellenar_cliente_por_nombre(self, nombre):
         if not nombre:
@@ -1789,14 +2481,15 @@ class CotizadorApp(tk.Tk):
         
         def guardar_cambios():
             # Actualizar en historial
-            hist_data = load_json_safe(HIST_PATH, [])
-            for r in hist_data:
-                if r.get("numero") and nombre.lower() in r.get("cliente", "").lower():
-                    r["cliente"] = var_nombre.get().strip()
-                    r["email"] = var_email.get().strip()
-                    r["direccion_cliente"] = var_dir.get().strip()
+            def editar_cliente(r):
+                if not (r.get("numero") and nombre.lower() in r.get("cliente", "").lower()):
+                    return False
+                r["cliente"] = var_nombre.get().strip()
+                r["email"] = var_email.get().strip()
+                r["direccion_cliente"] = var_dir.get().strip()
+                return True
             
-            save_json_safe(HIST_PATH, hist_data)
+            actualizar_historial(editar_cliente)
             self._cargar_clientes_frecuentes_en_combo()
             self.show_success("Cliente frecuente actualizado.")
             win.destroy()
@@ -1806,7 +2499,7 @@ class CotizadorApp(tk.Tk):
 
     def _abrir_calendario(self):
         """Abre ventana modal con calendario para seleccionar fecha."""
-        if not DateEntry:
+        if not TKCALENDAR_DISPONIBLE:
             self.show_info("La librería tkcalendar no está instalada.")
             return
         
@@ -1876,7 +2569,7 @@ class CotizadorApp(tk.Tk):
     
     def _abrir_calendario_filtro(self, var_fecha, parent_window):
         """Abre ventana modal con calendario para seleccionar fecha en filtros del historial."""
-        if not DateEntry:
+        if not TKCALENDAR_DISPONIBLE:
             self.show_info("La librería tkcalendar no está instalada.")
             return
         
@@ -1945,13 +2638,60 @@ class CotizadorApp(tk.Tk):
         if event.keysym in ("Up", "Down", "Return", "Escape", "Tab"):
             return
 
+        if self._ac_after_id:
+            self.after_cancel(self._ac_after_id)
+            self._ac_after_id = None
+
         texto = self._clean_var(self.var_cliente, self.placeholder_cliente)
         if not texto or len(self.clientes_hist) == 0:
             self._hide_suggestions()
             return
 
-        nombres = [r.get("cliente", "") for r in self.clientes_hist.values()]
-        matches = difflib.get_close_matches(texto, nombres, n=8, cutoff=0.2)
+        # Debounce: solo la última tecla de una ráfaga dispara la búsqueda
+        self._ac_after_id = self.after(120, self._do_autocomplete, texto)
+
+    def _do_autocomplete(self, texto):
+        """Busca clientes parecidos a `texto` y muestra la lista de sugerencias."""
+        self._ac_after_id = None
+
+        # Misma normalización que la lista: "nandu" encuentra "Ñandú"
+        texto_l = normalizar_busqueda(texto)
+        lcs = self._clientes_lc_ordenados
+        origs = self._clientes_orig_ordenados
+
+        # Los nombres que empiezan con el texto forman un rango contiguo de la
+        # lista ordenada: se ubica con bisect en O(log N)
+        lo = bisect_left(lcs, texto_l)
+        hi = bisect_left(lcs, texto_l + "\U0010ffff", lo)
+        matches = origs[lo:min(hi, lo + MAX_SUGERENCIAS)]
+
+        if len(matches) < 5:
+            # Pocas coincidencias por prefijo: completar con los que contienen el
+            # texto. Si solo se agregaron letras al final, los candidatos son un
+            # subconjunto de la búsqueda anterior y no hace falta recorrer todo
+            previo = self._ac_contiene
+            if previo is not None and texto_l.startswith(previo[0]):
+                candidatos = previo[1]
+            else:
+                candidatos = range(len(lcs))
+            contiene = [i for i in candidatos if texto_l in lcs[i]]
+            self._ac_contiene = (texto_l, contiene)
+            for i in contiene:
+                if len(matches) >= MAX_SUGERENCIAS:
+                    break
+                if not lcs[i].startswith(texto_l):
+                    matches.append(origs[i])
+
+        if not matches:
+            # Sin coincidencias literales: tolerar errores de tipeo
+            if rf_process is not None:
+                matches = [m for m, _, _ in rf_process.extract(
+                    texto, origs, scorer=rf_fuzz.WRatio, limit=MAX_SUGERENCIAS,
+                    score_cutoff=20, processor=rf_utils.default_process,
+                )]
+            else:
+                import difflib
+                matches = difflib.get_close_matches(texto, origs, n=MAX_SUGERENCIAS, cutoff=0.2)
 
         if not matches:
             self._hide_suggestions()
@@ -2024,7 +2764,7 @@ class CotizadorApp(tk.Tk):
 
     # ==== HISTORIAL / EXPORT / ESTADOS ================================
     def abrir_historial(self):
-        hist_data = load_json_safe(HIST_PATH, [])
+        hist_data = load_historial()
         if not hist_data:
             self.show_info("No hay cotizaciones registradas en el historial.")
             return
@@ -2034,6 +2774,27 @@ class CotizadorApp(tk.Tk):
         win.state('zoomed')  # Maximizar la ventana
         win.grab_set()
 
+        # Índices para filtrar sin normalizar todo el historial en cada tecla:
+        # hist_norm[i] = (registro, numero en minúsculas, cliente en minúsculas)
+        # por_estado[estado] = índices de hist_data con ese estado ("Todos" = todos)
+        # fechas_parseadas[(idx, por_entrega)] = fecha ya parseada (se llena al filtrar)
+        hist_norm = []
+        por_estado = {}
+        fechas_parseadas = {}
+
+        def indexar_historial():
+            hist_norm[:] = [
+                (r, r.get("numero", "").lower(), r.get("cliente", "").lower())
+                for r in hist_data
+            ]
+            por_estado.clear()
+            fechas_parseadas.clear()
+            por_estado["Todos"] = list(range(len(hist_data)))
+            for idx, r in enumerate(hist_data):
+                por_estado.setdefault(r.get("estado", "Generada"), []).append(idx)
+
+        indexar_historial()
+
         # Frame superior para filtros - Todo en una fila
         top = ttk.Frame(win)
         top.pack(fill="x", padx=10, pady=8)
@@ -2119,6 +2880,30 @@ class CotizadorApp(tk.Tk):
         bottom = ttk.Frame(win)
         bottom.pack(fill="x", padx=10, pady=5)
 
+        def registro_de_fila(item_id):
+            """Registro de hist_data mostrado en la fila (su iid es el índice)."""
+            try:
+                return hist_data[int(item_id)]
+            except (ValueError, IndexError):
+                return None
+
+        def guardar_estado(registro, estado):
+            """
+            Cambia el estado del registro y lo guarda releyendo el archivo:
+            hist_data es una foto tomada al abrir y no incluye las cotizaciones
+            que se generaron después con la ventana abierta.
+            """
+            registro["estado"] = estado
+            clave = (registro.get("numero"), registro.get("fecha"))
+
+            def cambiar(r):
+                if (r.get("numero"), r.get("fecha")) != clave:
+                    return False
+                r["estado"] = estado
+                return True
+
+            actualizar_historial(cambiar)
+
         def actualizar_estado_seleccion(new_state: str):
             sel = tree.selection()
             if not sel:
@@ -2126,11 +2911,8 @@ class CotizadorApp(tk.Tk):
                 return
 
             item_id = sel[0]
-            vals = tree.item(item_id, "values")
-            if not vals:
-                return
-            numero = vals[0]
-            estado_actual = vals[3]
+            numero = tree.set(item_id, "numero")
+            estado_actual = tree.set(item_id, "estado")
 
             if estado_actual == new_state:
                 self.show_info(f"La cotización ya está en estado {new_state}.")
@@ -2143,18 +2925,13 @@ class CotizadorApp(tk.Tk):
                 ):
                     return
 
-            found = False
-            for r in hist_data:
-                if r.get("numero") == numero:
-                    r["estado"] = new_state
-                    found = True
-                    break
-
-            if not found:
+            registro = registro_de_fila(item_id)
+            if registro is None:
                 self.show_error("No se encontró el registro en el historial.")
                 return
-
-            save_json_safe(HIST_PATH, hist_data)
+            guardar_estado(registro, new_state)
+            tree.set(item_id, "estado", new_state)  # La fila ya existe: solo cambia el estado
+            indexar_historial()
             refrescar_tree()
 
         ttk.Button(bottom, text="Marcar como Enviada",
@@ -2174,29 +2951,13 @@ class CotizadorApp(tk.Tk):
                 self.show_info("Selecciona una cotización del historial.")
                 return
             
-            item_id = sel[0]
-            vals = tree.item(item_id, "values")
-            if not vals:
-                return
-            numero = vals[0]
-            
-            # Buscar el registro completo en hist_data
-            registro = None
-            for r in hist_data:
-                if r.get("numero") == numero:
-                    registro = r
-                    break
-            
+            registro = registro_de_fila(sel[0])
             if not registro:
                 self.show_error("No se encontró el registro en el historial.")
                 return
             
             # Marcar la versión previa como Rechazada
-            for r in hist_data:
-                if r.get("numero") == numero:
-                    r["estado"] = "Rechazada"
-                    break
-            save_json_safe(HIST_PATH, hist_data)
+            guardar_estado(registro, "Rechazada")
             
             # Cargar la cotización en la interfaz
             self._cargar_cotizacion_desde_historial(registro)
@@ -2208,19 +2969,7 @@ class CotizadorApp(tk.Tk):
                 self.show_info("Selecciona una cotización del historial.")
                 return
             
-            item_id = sel[0]
-            vals = tree.item(item_id, "values")
-            if not vals:
-                return
-            numero = vals[0]
-            
-            # Buscar el registro completo en hist_data
-            registro = None
-            for r in hist_data:
-                if r.get("numero") == numero:
-                    registro = r
-                    break
-            
+            registro = registro_de_fila(sel[0])
             if not registro:
                 self.show_error("No se encontró el registro en el historial.")
                 return
@@ -2232,9 +2981,28 @@ class CotizadorApp(tk.Tk):
         ttk.Button(bottom, text="Nueva cotización", command=crear_nueva_cotizacion).pack(side="right", padx=5)
         ttk.Button(bottom, text="Nueva versión", command=crear_nueva_version).pack(side="right", padx=5)
 
+        carga_lotes = {"job": None}  # Lote pendiente de insertar en el tree
+        # Cada registro se inserta una sola vez con iid = índice en hist_data;
+        # al filtrar solo se ocultan (detach) y se vuelven a mostrar (move)
+        filas_creadas = set()
+
+        def valores_fila(r):
+            # Obtener símbolo de moneda para mostrar el total
+            moneda_registro = r.get("moneda", "SOLES")
+            # Usa constante global en lugar de recrear dict en cada iteración
+            simbolo = SIMBOLOS_MONEDA.get(moneda_registro, "S/")
+            return (
+                r.get("numero", ""),
+                r.get("fecha", ""),
+                r.get("fecha_entrega", ""),
+                r.get("cliente", ""),
+                r.get("estado", "Generada"),
+                f"{simbolo} {r.get('total', 0):,.2f}",
+                r.get("ruta_pdf", ""),
+            )
+
         def refrescar_tree(*args):
             from datetime import datetime
-            tree.delete(*tree.get_children())
             filtro_estado = var_f_estado.get()
             filtro_texto = var_f_text.get().strip().lower()
             fecha_desde = var_fecha_desde.get().strip()
@@ -2245,15 +3013,12 @@ class CotizadorApp(tk.Tk):
             fecha_desde_obj = parse_fecha_flexible(fecha_desde) if fecha_desde else None
             fecha_hasta_obj = parse_fecha_flexible(fecha_hasta) if fecha_hasta else None
 
-            for r in hist_data:
-                estado = r.get("estado", "Generada")
-                if filtro_estado != "Todos" and estado != filtro_estado:
-                    continue
-
-                numero = r.get("numero", "")
-                cliente = r.get("cliente", "")
+            coincidencias = []  # Índices de hist_data que pasan los filtros
+            # El filtro de estado es una búsqueda en el índice, no un recorrido
+            for idx in por_estado.get(filtro_estado, ()):
+                r, numero_l, cliente_l = hist_norm[idx]
                 if filtro_texto:
-                    if filtro_texto not in numero.lower() and filtro_texto not in cliente.lower():
+                    if filtro_texto not in numero_l and filtro_texto not in cliente_l:
                         continue
 
                 # Aplicar filtro de fecha
@@ -2265,8 +3030,12 @@ class CotizadorApp(tk.Tk):
                         fecha_str = r.get("fecha", "")
                     
                     if fecha_str:
-                        # Usar función helper optimizada para parsing
-                        fecha_obj = parse_fecha_flexible(fecha_str)
+                        # Cada fecha se parsea una sola vez mientras el diálogo está abierto
+                        clave = (idx, filtrar_por_entrega)
+                        if clave in fechas_parseadas:
+                            fecha_obj = fechas_parseadas[clave]
+                        else:
+                            fecha_obj = fechas_parseadas[clave] = parse_fecha_flexible(fecha_str)
                         
                         if fecha_obj:
                             if fecha_desde_obj and fecha_obj < fecha_desde_obj:
@@ -2281,29 +3050,40 @@ class CotizadorApp(tk.Tk):
                         if fecha_desde_obj or fecha_hasta_obj:
                             continue
 
-                # Obtener símbolo de moneda para mostrar el total
-                moneda_registro = r.get("moneda", "SOLES")
-                # Usa constante global en lugar de recrear dict en cada iteración
-                simbolo = SIMBOLOS_MONEDA.get(moneda_registro, "S/")
-
-                tree.insert(
-                    "", "end",
-                    values=(
-                        numero,
-                        r.get("fecha", ""),
-                        r.get("fecha_entrega", ""),
-                        cliente,
-                        estado,
-                        f"{simbolo} {r.get('total', 0):,.2f}",
-                        r.get("ruta_pdf", ""),
-                    )
-                )
+                coincidencias.append(idx)
+
+            # Mostrar en lotes: las primeras filas aparecen de inmediato y el
+            # resto se agrega en ciclos ociosos sin congelar la ventana
+            if carga_lotes["job"]:
+                win.after_cancel(carga_lotes["job"])
+                carga_lotes["job"] = None
+
+            def insertar_lote(inicio=0):
+                carga_lotes["job"] = None
+                if not tree.winfo_exists():
+                    return
+                fin = inicio + LOTE_HISTORIAL
+                with self._tree_batch(tree):
+                    if inicio == 0:
+                        # Las filas que no coinciden se ocultan (detach), no se borran
+                        tree.detach(*tree.get_children())
+                    for idx in coincidencias[inicio:fin]:
+                        iid = str(idx)
+                        if iid in filas_creadas:
+                            tree.move(iid, "", "end")  # Reinsertar la fila oculta
+                        else:
+                            tree.insert("", "end", iid=iid, values=valores_fila(hist_data[idx]))
+                            filas_creadas.add(iid)
+                if fin < len(coincidencias):
+                    carga_lotes["job"] = win.after_idle(insertar_lote, fin)
+
+            insertar_lote()
 
         def refrescar_tree_debounced(*args):
-            """Refrescar tree con debounce de 300ms para evitar refrescos innecesarios."""
+            """Refrescar tree con debounce de 120ms: una ráfaga de teclas = un refresco."""
             if hasattr(self, '_search_debounce_job') and self._search_debounce_job:
                 self.after_cancel(self._search_debounce_job)
-            self._search_debounce_job = self.after(300, refrescar_tree)
+            self._search_debounce_job = self.after(120, refrescar_tree)
         
         cb_estado.bind("<<ComboboxSelected>>", refrescar_tree)
         ent_buscar.bind("<KeyRelease>", refrescar_tree_debounced)
@@ -2317,11 +3097,7 @@ class CotizadorApp(tk.Tk):
                 item_id = tree.focus()
                 if not item_id:
                     return
-                vals = tree.item(item_id, "values")
-                if not vals or len(vals) < 7:
-                    self.show_warning("No se encontró ruta asociada.")
-                    return
-                ruta_nombre = vals[6]
+                ruta_nombre = tree.set(item_id, "ruta_pdf")
                 if not ruta_nombre:
                     self.show_warning("No hay ruta de archivo registrada.")
                     return
@@ -2352,43 +3128,65 @@ class CotizadorApp(tk.Tk):
         import shutil
         
         if limpiar_tree:
-            for i in self.tree.get_children():
-                self.tree.delete(i)
+            self.tree.delete(*self.tree.get_children())
             self.item_images.clear()
+            self._items.clear()
         
         ref_dir = self._get_referencias_dir()
         ref_dir.mkdir(exist_ok=True)
         
-        for item_data in items:
-            desc = item_data.get("descripcion", "")
-            cant = item_data.get("cantidad", "")
-            precio = item_data.get("precio", "")
-            subtotal = item_data.get("subtotal", "")
-            img_path = item_data.get("imagen", "")
+        # Carga masiva: la Treeview se redibuja una sola vez al final
+        with self._tree_batch():
+            for item_data in items:
+                desc = item_data.get("descripcion", "")
+                cant = item_data.get("cantidad", "")
+                precio = item_data.get("precio", "")
+                subtotal = item_data.get("subtotal", "")
+                img_path = item_data.get("imagen", "")
             
-            # Insertar item en el tree
-            iid = self.tree.insert(
-                "", "end",
-                values=("", desc, cant, precio, subtotal)
-            )
+                row = ItemRow(
+                    desc,
+                    self._milesimas_o_cero(cant),
+                    self._centavos_o_cero(precio),
+                    self._centavos_o_cero(subtotal),  # Se respeta el subtotal guardado
+                    None,
+                )
+
+                # Insertar item en el tree
+                iid = self.tree.insert("", "end", values=self._valores_fila(row))
+                row = self._items[iid] = row._replace(iid=iid)
             
-            # Copiar imagen de referencia si existe
-            if img_path and Path(img_path).exists():
-                try:
-                    # Crear copia de la imagen en Referencias
-                    img_src = Path(img_path)
-                    img_ext = img_src.suffix
-                    new_img_name = f"ref_{iid}{img_ext}"
-                    new_img_path = ref_dir / new_img_name
-                    shutil.copy2(img_src, new_img_path)
-                    self.item_images[iid] = str(new_img_path)
+                # Copiar imagen de referencia si existe
+                if img_path and Path(img_path).exists():
+                    try:
+                        # Crear copia de la imagen en Referencias
+                        img_src = Path(img_path)
+                        img_ext = img_src.suffix
+                        new_img_name = f"ref_{iid}{img_ext}"
+                        new_img_path = ref_dir / new_img_name
+                        shutil.copy2(img_src, new_img_path)
+                        self.item_images[iid] = str(new_img_path)
                     
-                    # Actualizar icono en el tree
-                    self.tree.item(iid, values=("📷", desc, cant, precio, subtotal))
-                except Exception as e:
-                    print(f"No se pudo copiar imagen: {e}")
+                        # Actualizar icono en el tree (solo esa columna)
+                        self.tree.set(iid, "img", "📷")
+                    except Exception as e:
+                        print(f"No se pudo copiar imagen: {e}")
         
         self._refresh_totals()
+
+    @staticmethod
+    def _centavos_o_cero(valor):
+        try:
+            return a_centavos(valor)
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def _milesimas_o_cero(valor):
+        try:
+            return a_milesimas(valor)
+        except ValueError:
+            return 0
     
     def _cargar_cotizacion_desde_historial(self, registro):
         """Carga una cotización desde el historial para crear una nueva versión."""
@@ -2442,8 +3240,11 @@ class CotizadorApp(tk.Tk):
 
     def exportar_historial_excel(self):
         """Exporta el historial a CSV con formato mejorado y más información."""
-        data = load_json_safe(HIST_PATH, [])
-        if not data:
+        import csv
+
+        # Solo se verifica que haya al menos un registro; el historial se
+        # lee recién al escribir, registro por registro
+        if next(iter_historial(), None) is None:
             self.show_info("No hay cotizaciones para exportar.")
             return
 
@@ -2460,89 +3261,100 @@ class CotizadorApp(tk.Tk):
             "estado", "condicion_pago", "validez", "items_count", "ruta_pdf"
         ]
         
+        # Totales para el resumen al final (se acumulan mientras se escriben las filas)
+        total_general = 0
+        count_por_estado = {}
+
+        def filas():
+            """Genera cada fila como tupla en el orden de `campos`."""
+            nonlocal total_general
+            for r in iter_historial():
+                estado = r.get("estado", "Generada")
+                count_por_estado[estado] = count_por_estado.get(estado, 0) + 1
+                try:
+                    total_general += float(r.get("total", 0))
+                except (TypeError, ValueError):
+                    pass
+
+                yield (
+                    r.get("numero", ""),
+                    r.get("fecha", ""),
+                    r.get("fecha_entrega", "Por definir"),
+                    r.get("cliente", ""),
+                    r.get("email", ""),
+                    r.get("direccion_cliente", ""),
+                    r.get("moneda", "SOLES"),
+                    r.get("subtotal", 0),
+                    r.get("igv", 0),
+                    r.get("total", 0),
+                    estado,
+                    r.get("condicion_pago", ""),
+                    r.get("validez", ""),
+                    len(r.get("items", [])),
+                    r.get("ruta_pdf", ""),
+                )
+
+        def fila_resumen(**valores):
+            return [valores.get(c, "") for c in campos]
+
         try:
-            with open(file_path, "w", newline="", encoding="utf-8-sig") as f:
-                writer = csv.DictWriter(f, fieldnames=campos)
-                writer.writeheader()
-                
-                # Calcular totales para resumen al final
-                total_general = 0
-                count_por_estado = {}
-                
-                for r in data:
-                    # Contar items
-                    items_count = len(r.get("items", []))
-                    
-                    # Preparar fila
-                    row = {
-                        "numero": r.get("numero", ""),
-                        "fecha": r.get("fecha", ""),
-                        "fecha_entrega": r.get("fecha_entrega", "Por definir"),
-                        "cliente": r.get("cliente", ""),
-                        "email": r.get("email", ""),
-                        "direccion_cliente": r.get("direccion_cliente", ""),
-                        "moneda": r.get("moneda", "SOLES"),
-                        "subtotal": r.get("subtotal", 0),
-                        "igv": r.get("igv", 0),
-                        "total": r.get("total", 0),
-                        "estado": r.get("estado", "Generada"),
-                        "condicion_pago": r.get("condicion_pago", ""),
-                        "validez": r.get("validez", ""),
-                        "items_count": items_count,
-                        "ruta_pdf": r.get("ruta_pdf", "")
-                    }
-                    
-                    writer.writerow(row)
-                    
-                    # Actualizar totales
-                    try:
-                        total_general += float(r.get("total", 0))
-                        estado = row["estado"]
-                        count_por_estado[estado] = count_por_estado.get(estado, 0) + 1
-                    except:
-                        pass
+            # Buffer de 1 MiB: muchas filas cortas, pocas llamadas a write()
+            with open(file_path, "w", newline="", encoding="utf-8-sig",
+                      buffering=1024 * 1024) as f:
+                writer = csv.writer(f)
+                writer.writerow(campos)
+                # writerows consume el generador en C, sin un writerow por registro
+                writer.writerows(filas())
                 
                 # Agregar línea de resumen
-                writer.writerow({})
-                writer.writerow({"numero": "RESUMEN", "total": total_general})
-                writer.writerow({"numero": f"Total cotizaciones: {len(data)}"})
+                writer.writerow(fila_resumen())
+                writer.writerow(fila_resumen(numero="RESUMEN", total=total_general))
+                total_registros = sum(count_por_estado.values())
+                writer.writerow(fila_resumen(numero=f"Total cotizaciones: {total_registros}"))
                 for estado, count in count_por_estado.items():
-                    writer.writerow({"numero": f"  {estado}: {count}"})
+                    writer.writerow(fila_resumen(numero=f"  {estado}: {count}"))
                 
             self.show_success(f"Historial exportado con éxito:\n{file_path}")
         except Exception as e:
             self.show_error(f"No se pudo exportar: {e}")
 
     # ==== EMAIL ========================================================
-    def _enviar_correo(self, pdf_path, numero):
+    def _pedir_destinatario(self):
+        """
+        Valida la configuración SMTP y obtiene el correo del cliente antes de
+        generar el PDF. Retorna el destinatario o None si no se puede enviar.
+        """
+        servidor = self.email_config.get("servidor", "")
+        usuario = self.email_config.get("usuario", "")
+        password = self.email_config.get("password", "")
+
+        if not servidor or not usuario or not password:
+            self.show_warning("Configura servidor, usuario y password en Configuración.")
+            return None
+
         dest = self._clean_var(self.var_cliente_email, self.placeholder_email_cliente)
         if not dest:
-            dest = simpledialog.askstring("Correo", "Correo del cliente:")
+            dest = simpledialog.askstring("Correo", "Correo del cliente:", parent=self)
             if not dest:
                 self.show_info("No se envió correo (sin destinatario).")
-                return
+                return None
 
-        if not EMAIL_PATTERN.match(dest):
+        dest = dest.strip()
+        if not EMAIL_PATTERN.fullmatch(dest):
             self.show_warning("Email inválido.")
-            return
+            return None
+        return dest
 
-        servidor = self.email_config.get("servidor", "")
-        usuario = self.email_config.get("usuario", "")
-        password = self.email_config.get("password", "")
-        puerto = self.email_config.get("puerto", 587)
-        usar_tls = self.email_config.get("usar_tls", True)
+    def _enviar_correo(self, pdf_path, numero, dest, cliente, calentamiento=None):
+        from email.message import EmailMessage
 
-        if not servidor or not usuario or not password:
-            self.show_warning("Configura servidor, usuario y password en Configuración.")
-            return
+        usuario = self.email_config.get("usuario", "")
 
         msg = EmailMessage()
         msg["Subject"] = f"Cotización {numero}"
         msg["From"] = usuario
         msg["To"] = dest
 
-        cliente = self._clean_var(self.var_cliente, self.placeholder_cliente)
-
         body = (
             f"Estimado(a) {cliente},\n\n"
             f"Adjuntamos la cotización {numero}.\n\n"
@@ -2551,45 +3363,152 @@ class CotizadorApp(tk.Tk):
         )
         msg.set_content(body)
 
+        # Lectura del adjunto, TLS, login y envío van al worker; el resultado
+        # vuelve al hilo de Tk con after()
+        self.show_info(f"Enviando cotización a {dest}...")
+        fut = self._encolar(
+            self._smtp_pool, self._enviar_mensaje, msg, pdf_path, numero,
+            dict(self.email_config), calentamiento
+        )
+        fut.add_done_callback(lambda f: self.after(0, self._on_correo_enviado, f, dest))
+
+    def _enviar_mensaje(self, msg, pdf_path, numero, email_config, calentamiento=None):
+        """
+        Adjunta el PDF y envía el mensaje (corre en el worker SMTP, no toca Tk).
+        `calentamiento` es el futuro de la conexión anticipada, si la hubo.
+        Retorna None si se envió o el texto del error.
+        """
+        import mmap
+        import smtplib
+        from email import policy
+
         try:
-            with open(pdf_path, "rb") as f:
-                data = f.read()
-            msg.add_attachment(
-                data,
-                maintype="application",
-                subtype="pdf",
-                filename=f"Cotizacion_{numero}.pdf"
-            )
+            # El PDF se mapea en memoria y se codifica en base64 directamente
+            # desde el mapa, sin una copia completa en un bytes intermedio
+            with open(pdf_path, "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                    memoryview(mm) as data:
+                msg.add_attachment(
+                    data,
+                    maintype="application",
+                    subtype="pdf",
+                    filename=f"Cotizacion_{numero}.pdf"
+                )
+            # Serializar una sola vez (ya con CRLF) y liberar el adjunto en base64
+            # del mensaje antes del envío; el reintento reutiliza los mismos bytes
+            remitente, destinatario = str(msg["From"]), str(msg["To"])
+            datos = msg.as_bytes(policy=policy.SMTP)
+            msg.clear()
         except Exception as e:
-            self.show_error(f"No se pudo adjuntar el PDF: {e}")
-            return
+            return f"No se pudo adjuntar el PDF: {e}"
+
+        # Ya terminó (mismo worker, en orden): si no pudo conectar, no se repite
+        # la espera del timeout para llegar al mismo error
+        error_conexion = calentamiento.exception() if calentamiento is not None else None
+        if error_conexion is not None:
+            return f"No se pudo enviar el correo: {error_conexion}"
 
         try:
-            with smtplib.SMTP(servidor, puerto, timeout=20) as smtp:
-                if usar_tls:
-                    smtp.starttls()
-                smtp.login(usuario, password)
-                smtp.send_message(msg)
-            self.show_success(f"Cotización enviada a {dest}")
+            try:
+                self._get_smtp(email_config).sendmail(remitente, [destinatario], datos)
+            except smtplib.SMTPServerDisconnected:
+                # La conexión reutilizada se cerró del lado del servidor: reconectar una vez
+                self._cerrar_smtp()
+                self._get_smtp(email_config).sendmail(remitente, [destinatario], datos)
         except Exception as e:
-            self.show_error(f"No se pudo enviar el correo: {e}")
+            self._cerrar_smtp()
+            return f"No se pudo enviar el correo: {e}"
+
+        if not email_config.get("reutilizar_conexion", True):
+            self._cerrar_smtp()
+        return None
+
+    def _on_correo_enviado(self, fut, dest):
+        error = fut.result()
+        if error:
+            self.show_error(error)
+        else:
+            self.show_success(f"Cotización enviada a {dest}")
+
+    def _get_smtp(self, email_config):
+        """
+        Devuelve una conexión SMTP autenticada.
+        Reutiliza la anterior si sigue viva (NOOP) y la configuración no cambió.
+        """
+        import smtplib
+
+        servidor = email_config.get("servidor", "")
+        puerto = email_config.get("puerto", 587)
+        usuario = email_config.get("usuario", "")
+        password = email_config.get("password", "")
+        usar_tls = email_config.get("usar_tls", True)
+        key = (servidor, puerto, usuario, password, usar_tls)
+
+        if self._smtp is not None:
+            if self._smtp_key == key:
+                try:
+                    if self._smtp.noop()[0] == 250:
+                        return self._smtp
+                except (smtplib.SMTPException, OSError):
+                    pass
+            self._cerrar_smtp()
+
+        smtp = smtplib.SMTP(servidor, puerto, timeout=20)
+        try:
+            if usar_tls:
+                smtp.starttls()
+            smtp.login(usuario, password)
+        except Exception:
+            smtp.close()
+            raise
+
+        self._smtp = smtp
+        self._smtp_key = key
+        return smtp
+
+    def _descartar_calentamiento_smtp(self, email_config):
+        """Sin envío tras la conexión anticipada: se cierra si no se reutiliza."""
+        if not email_config.get("reutilizar_conexion", True):
+            self._encolar(self._smtp_pool, self._cerrar_smtp)
+
+    def _cerrar_smtp(self):
+        """Cierra la conexión SMTP reutilizable, si existe."""
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            try:
+                self._smtp.close()
+            except Exception:
+                pass
+        self._smtp = None
+        self._smtp_key = None
 
     # ==== UTIL: ABRIR ARCHIVOS / CARPETA ==============================
-    def _abrir_pdf(self, path: Path):
+    @staticmethod
+    def _abrir_con_sistema(path: Path):
+        """Abre un archivo o carpeta con la aplicación predeterminada del sistema."""
         if os.name == "nt":
             os.startfile(str(path))
-        elif sys.platform == "darwin":
-            subprocess.Popen(["open", str(path)])
-        else:
-            subprocess.Popen(["xdg-open", str(path)])
+            return
+        comando = "open" if sys.platform == "darwin" else "xdg-open"
+        # Sin preexec_fn CPython (3.10+ en Linux) lanza el hijo con vfork, sin
+        # copiar la memoria del proceso; la nueva sesión lo desacopla de la app.
+        subprocess.Popen(
+            [comando, str(path)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            start_new_session=True,
+        )
+
+    def _abrir_pdf(self, path: Path):
+        self._abrir_con_sistema(path)
 
     def _abrir_carpeta(self, folder: Path):
-        if os.name == "nt":
-            os.startfile(str(folder))
-        elif sys.platform == "darwin":
-            subprocess.Popen(["open", str(folder)])
-        else:
-            subprocess.Popen(["xdg-open", str(folder)])
+        self._abrir_con_sistema(folder)
 
     def abrir_carpeta_cotizaciones(self):
         cot_dir = self._get_cotizaciones_dir()
@@ -2623,10 +3542,10 @@ class CotizadorApp(tk.Tk):
         else:
             self._reset_text_placeholder(self.txt_terms, self.placeholder_terms)
 
-        for i in self.tree.get_children():
-            self.tree.delete(i)
+        self.tree.delete(*self.tree.get_children())
 
         self.item_images.clear()
+        self._items.clear()
         self.pending_image_path = None
 
         self._reset_form()
@@ -2635,8 +3554,13 @@ class CotizadorApp(tk.Tk):
         self._clear_preview()
 
     # ==== CORE: CREAR PDF EN /Cotizaciones ============================
-    def _crear_pdf_en_carpeta(self):
-        if not self.tree.get_children():
+    def _preparar_datos_pdf(self):
+        """
+        Valida la cotización y toma una foto de todo lo que necesita el PDF.
+        Corre en el hilo de Tk; el dict resultante no referencia widgets, así
+        _renderizar_pdf puede usarlo desde el worker.
+        """
+        if not self._items:
             self.show_warning("Agrega al menos un ítem para generar el PDF.")
             return None
 
@@ -2652,12 +3576,105 @@ class CotizadorApp(tk.Tk):
 
         numero = self._next_numero_cotizacion()
 
-        safe_cliente = re.sub(r"[^\w\s\-_.]", "", cliente_raw).strip()
-        safe_cliente = safe_cliente.replace("  ", " ").replace(" ", "_") or "SinCliente"
+        safe_cliente = nombre_archivo_seguro(cliente_raw)
         file_name = f"{safe_cliente} - {numero}.pdf"
         file_path = cot_dir / file_name
 
-        pdf = CotizadorPDF(self.empresa, self.logo_path, numero=numero)
+        filas = []
+        ref_records = []
+
+        # Se recorre el modelo en memoria: ninguna llamada Tcl por fila
+        for idx, row in enumerate(self._items.values(), start=1):
+            item = row.iid
+            d = row.desc
+            img_src = self.item_images.get(item)
+            ref_code = f"R{idx}" if img_src else ""
+            filas.append((
+                d,
+                ref_code,
+                formatear_cantidad(row.cant_m),
+                formatear_centavos(row.precio_c),
+                formatear_centavos(row.sub_c),
+            ))
+
+            if img_src:
+                try:
+                    src_path = Path(img_src)
+                    ext = src_path.suffix or ".png"
+                    ref_name = f"{numero}_item{idx:02d}{ext}"
+                    target_path = ref_dir / ref_name
+
+                    if src_path != target_path:
+                        # En el mismo disco basta un renombrado atómico; si la
+                        # carpeta de referencias está en otro disco, os.replace
+                        # falla y se copia y borra el origen (como shutil.move)
+                        try:
+                            os.replace(src_path, target_path)
+                        except OSError:
+                            shutil.copyfile(src_path, target_path)
+                            try:
+                                os.unlink(src_path)
+                            except OSError:
+                                pass  # Un TMP_ que quede lo borra el barrido al iniciar
+
+                    self.item_images[item] = str(target_path)
+                    ref_records.append((ref_code, d, target_path))
+                except Exception:
+                    pass
+
+        # Mismos totales (en centavos) que los mostrados en pantalla
+        subtotal_c, igv_c, total_c = self._calcular_totales_c()
+
+        # Construir sección unificada de términos y condiciones
+        condiciones_texto = []
+        
+        # Condición de pago
+        condicion_pago = self.var_condicion_pago.get().strip()
+        if condicion_pago:
+            condiciones_texto.append(f"- Condición de Pago: {condicion_pago}")
+        
+        # Validez
+        validez = self.var_validez.get().strip()
+        if validez:
+            condiciones_texto.append(f"- Validez de Oferta: {validez}")
+        
+        # Fecha de entrega
+        fecha_entrega = self.var_fecha_entrega.get().strip()
+        fecha_entrega_texto = fecha_entrega if fecha_entrega else "Por definir"
+        condiciones_texto.append(f"- Fecha de Entrega: {fecha_entrega_texto}")
+        
+        # Términos adicionales - cada línea con su guion
+        terms = self.txt_terms.get("1.0", "end").strip()
+        if terms and terms != self.placeholder_terms:
+            # Dividir por líneas y agregar guion a cada una
+            lineas_terminos = terms.split('\n')
+            for linea in lineas_terminos:
+                linea_limpia = linea.strip()
+                if linea_limpia:
+                    condiciones_texto.append(f"- {linea_limpia}")
+
+        return {
+            "numero": numero,
+            "file_path": file_path,
+            "empresa": dict(self.empresa),
+            "logo_path": self.logo_path,
+            "fecha": datetime.now().strftime('%d/%m/%Y'),
+            "cliente": cliente_raw,
+            "direccion": self._clean_var(self.var_direccion, self.placeholder_dir_cliente),
+            "email": self._clean_var(self.var_cliente_email, self.placeholder_email_cliente),
+            "ruc": self._clean_var(self.var_cliente_ruc, self.placeholder_cliente_ruc),
+            "filas": filas,
+            "ref_records": ref_records,
+            "subtotal": subtotal_c / 100,
+            "igv": igv_c / 100,
+            "total": total_c / 100,
+            "condiciones": condiciones_texto,
+        }
+
+    @staticmethod
+    def _renderizar_pdf(datos):
+        """Dibuja y escribe el PDF a partir de la foto de _preparar_datos_pdf (corre en el worker)."""
+        pdf = get_clase_pdf()(datos["empresa"], datos["logo_path"], numero=datos["numero"])
         pdf.set_auto_page_break(True, 15)
         pdf.add_page()
 
@@ -2668,20 +3685,17 @@ class CotizadorApp(tk.Tk):
 
         pdf.set_font("Helvetica", "", 11)
         pdf.set_text_color(40, 40, 40)
-        pdf.cell(0, 6, f"Fecha: {datetime.now().strftime('%d/%m/%Y')}", ln=1)
-        pdf.cell(0, 6, f"Cliente: {cliente_raw}", ln=1)
+        pdf.cell(0, 6, f"Fecha: {datos['fecha']}", ln=1)
+        pdf.cell(0, 6, f"Cliente: {datos['cliente']}", ln=1)
 
-        direccion_val = self._clean_var(self.var_direccion, self.placeholder_dir_cliente)
-        if direccion_val:
-            pdf.cell(0, 6, f"Dirección: {direccion_val}", ln=1)
+        if datos["direccion"]:
+            pdf.cell(0, 6, f"Dirección: {datos['direccion']}", ln=1)
 
-        email_val = self._clean_var(self.var_cliente_email, self.placeholder_email_cliente)
-        if email_val:
-            pdf.cell(0, 6, f"Email: {email_val}", ln=1)
+        if datos["email"]:
+            pdf.cell(0, 6, f"Email: {datos['email']}", ln=1)
         
-        ruc_val = self._clean_var(self.var_cliente_ruc, self.placeholder_cliente_ruc)
-        if ruc_val:
-            pdf.cell(0, 6, f"RUC: {ruc_val}", ln=1)
+        if datos["ruc"]:
+            pdf.cell(0, 6, f"RUC: {datos['ruc']}", ln=1)
 
         pdf.ln(8)
 
@@ -2699,23 +3713,23 @@ class CotizadorApp(tk.Tk):
         pdf.set_font("Helvetica", "", 10)
         pdf.set_text_color(50, 50, 50)
 
-        ref_records = []
-
-        for idx, item in enumerate(self.tree.get_children(), start=1):
-            icon, d, c, p, s = self.tree.item(item)["values"]
-            
-            # Reemplazar " | " de vuelta a saltos de línea para el PDF
-            d = d.replace(' | ', '\n')
-
-            img_src = self.item_images.get(item)
-            ref_code = f"R{idx}" if img_src else ""
-
-            lines = pdf.multi_cell(widths[0], 6, d, split_only=True)
-            row_h = 6 * max(1, len(lines))
-            x = pdf.get_x()
+        for d, ref_code, c, p, s in datos["filas"]:
+            # Descripción de una sola línea: celda simple con el ancho fijo de la
+            # columna, sin pasar por el ajuste de texto de multi_cell
+            una_linea = "\n" not in d and pdf.get_string_width(d) <= widths[0] - 2 * pdf.c_margin
             y = pdf.get_y()
+            if una_linea:
+                row_h = 6
+            elif y + 6 * cota_lineas_pdf(pdf, widths[0], d) <= pdf.page_break_trigger:
+                # Cabe seguro en la página: multi_cell parte el texto una sola vez
+                # al dibujarlo y la altura sale de dónde deja el cursor
+                row_h = None
+            else:
+                # Cerca del pie hace falta la altura exacta antes de dibujar
+                row_h = 6 * len(partir_lineas_pdf(pdf, widths[0], 6, d) or ("",))
+            x = pdf.get_x()
 
-            if y + row_h > pdf.page_break_trigger:
+            if row_h is not None and y + row_h > pdf.page_break_trigger:
                 pdf.add_page()
                 pdf.set_font("Helvetica", "B", 11)
                 pdf.set_fill_color(240, 240, 240)
@@ -2729,8 +3743,15 @@ class CotizadorApp(tk.Tk):
                 x = pdf.get_x()
                 y = pdf.get_y()
 
-            pdf.multi_cell(widths[0], 6, d, border=1)
-            pdf.set_xy(x + widths[0], y)
+            if una_linea:
+                pdf.cell(widths[0], row_h, d, border=1)
+            else:
+                # multi_cell justifica cada línea partida salvo la última de cada
+                # párrafo; cell no admite align="J", así que no sirve para dibujarlas
+                pdf.multi_cell(widths[0], 6, d, border=1)
+                if row_h is None:
+                    row_h = pdf.get_y() - y
+                pdf.set_xy(x + widths[0], y)
 
             pdf.cell(widths[1], row_h, ref_code, border=1, align="C")
             pdf.cell(widths[2], row_h, c, border=1, align="R")
@@ -2738,31 +3759,7 @@ class CotizadorApp(tk.Tk):
             pdf.cell(widths[4], row_h, s, border=1, align="R")
             pdf.ln(row_h)
 
-            if img_src:
-                try:
-                    src_path = Path(img_src)
-                    ext = src_path.suffix or ".png"
-                    ref_name = f"{numero}_item{idx:02d}{ext}"
-                    target_path = ref_dir / ref_name
-
-                    if src_path != target_path:
-                        try:
-                            shutil.move(src_path, target_path)
-                        except Exception:
-                            shutil.copyfile(src_path, target_path)
-
-                    self.item_images[item] = str(target_path)
-                    ref_records.append((ref_code, d, target_path))
-                except Exception:
-                    pass
-
-        items = self.tree.get_children()
-        subtotales = [
-            float(self.tree.item(i)["values"][4]) for i in items
-        ] if items else []
-        subtotal = sum(subtotales)
-        igv = subtotal * IGV_RATE if self.var_igv_enabled.get() else 0.0
-        total = subtotal + igv
+        subtotal, igv, total = datos["subtotal"], datos["igv"], datos["total"]
 
         pdf.ln(5)
         table_width = sum(widths)
@@ -2796,42 +3793,15 @@ class CotizadorApp(tk.Tk):
         pdf.set_font("Helvetica", "", 9)
         pdf.set_text_color(50, 50, 50)
         
-        # Construir sección unificada
-        condiciones_texto = []
-        
-        # Condición de pago
-        condicion_pago = self.var_condicion_pago.get().strip()
-        if condicion_pago:
-            condiciones_texto.append(f"- Condición de Pago: {condicion_pago}")
-        
-        # Validez
-        validez = self.var_validez.get().strip()
-        if validez:
-            condiciones_texto.append(f"- Validez de Oferta: {validez}")
-        
-        # Fecha de entrega
-        fecha_entrega = self.var_fecha_entrega.get().strip()
-        fecha_entrega_texto = fecha_entrega if fecha_entrega else "Por definir"
-        condiciones_texto.append(f"- Fecha de Entrega: {fecha_entrega_texto}")
-        
-        # Términos adicionales - cada línea con su guion
-        terms = self.txt_terms.get("1.0", "end").strip()
-        if terms and terms != self.placeholder_terms:
-            # Dividir por líneas y agregar guion a cada una
-            lineas_terminos = terms.split('\n')
-            for linea in lineas_terminos:
-                linea_limpia = linea.strip()
-                if linea_limpia:
-                    condiciones_texto.append(f"- {linea_limpia}")
-        
         # Mostrar condiciones unificadas
-        if condiciones_texto:
-            for condicion in condiciones_texto:
-                pdf.multi_cell(0, 5, condicion)
+        if datos["condiciones"]:
+            for condicion in datos["condiciones"]:
+                pdf.multi_cell(0, 5, condicion, new_x="LMARGIN", new_y="NEXT")
         else:
             pdf.cell(0, 5, "Sin términos y condiciones especificados", ln=1)
 
         # REFERENCIAS
+        ref_records = datos["ref_records"]
         if ref_records:
             pdf.add_page()
             pdf.set_font("Helvetica", "B", 14)
@@ -2841,6 +3811,8 @@ class CotizadorApp(tk.Tk):
             usable_width = pdf.w - pdf.l_margin - pdf.r_margin
             text_w = usable_width * 0.45
             img_max_w = usable_width * 0.45
+            # Bytes y tamaño de cada imagen, leídos una sola vez por archivo
+            img_cache = {}
 
             for ref_code, desc, img_path in ref_records:
                 if pdf.get_y() > pdf.page_break_trigger - 80:
@@ -2860,9 +3832,13 @@ class CotizadorApp(tk.Tk):
 
                 img_bottom = y_start
                 try:
-                    from PIL import Image
-                    im = Image.open(img_path)
-                    w_px, h_px = im.size
+                    cache = img_cache.get(img_path)
+                    if cache is None:
+                        from PIL import Image
+                        data = Path(img_path).read_bytes()
+                        with Image.open(io.BytesIO(data)) as im:
+                            cache = img_cache[img_path] = (data, im.size)
+                    data, (w_px, h_px) = cache
 
                     max_h = pdf.page_break_trigger - pdf.get_y() - 15
                     if max_h < 40:
@@ -2883,50 +3859,119 @@ class CotizadorApp(tk.Tk):
                     draw_w = w_px * scale
                     draw_h = h_px * scale
 
-                    pdf.image(str(img_path), x=x_img, y=y_start, w=draw_w)
+                    pdf.image(io.BytesIO(data), x=x_img, y=y_start, w=draw_w)
                     img_bottom = y_start + draw_h
                 except Exception:
                     pass
 
                 pdf.set_y(max(text_bottom, img_bottom) + 10)
 
-        pdf.output(str(file_path))
-        del pdf
-
-        return numero, cot_dir, file_path, subtotal, igv, total
+        pdf.output(str(datos["file_path"]))
 
     # ==== GENERAR PDF / ENVIAR ========================================
-    def generar_pdf(self):
-        result = self._crear_pdf_en_carpeta()
-        if result is None:
+    def _generar_pdf_en_segundo_plano(self, estado, al_terminar, al_fallar=None):
+        """Toma los datos en el hilo principal; dibuja y escribe el PDF en el worker.
+
+        El registro de historial se arma antes de enviar el trabajo para que
+        corresponda exactamente al contenido del PDF, y el formulario se limpia
+        enseguida para empezar otra cotización mientras el worker dibuja.
+        `al_terminar(registro, ruta)` se llama en el hilo de Tk cuando el
+        archivo ya está escrito; `al_fallar()`, si no se pudo generar.
+        """
+        if self._imagenes_pendientes:
+            # Las imágenes recién elegidas deben estar escritas antes de moverlas.
+            # No se las espera aquí: sus callbacks necesitan el hilo de Tk libre
+            self._set_botones_pdf("disabled")
+            self.show_info("Terminando de preparar las imágenes...")
+            self.after(100, self._generar_cuando_imagenes_listas, estado, al_terminar, al_fallar)
             return
 
-        numero, cot_dir, file_path, subtotal, igv, total = result
-        self._guardar_en_historial(numero, str(file_path), subtotal, igv, total, "Generada")
+        datos = self._preparar_datos_pdf()
+        if datos is None:
+            if al_fallar is not None:
+                al_fallar()
+            return
 
-        try:
-            self._abrir_pdf(file_path)
-        except Exception as e:
-            self.show_error(f"No se pudo abrir el PDF: {e}")
+        numero, file_path = datos["numero"], datos["file_path"]
+        registro = self._armar_registro_historial(
+            numero, str(file_path), datos["subtotal"], datos["igv"], datos["total"], estado
+        )
+
+        self._set_botones_pdf("disabled")
+        self.show_info(f"Generando PDF {numero}...")
 
-        self.show_success(f"Cotización generada: {numero}")
+        # El worker no toca Tk: solo usa la foto de datos; el resultado vuelve con after()
+        fut = self._encolar(self._pdf_pool, self._renderizar_pdf, datos)
+        fut.add_done_callback(
+            lambda f: self.after(
+                0, self._on_pdf_done, f, registro, file_path, al_terminar, al_fallar
+            )
+        )
+        # La foto ya está tomada: lo que se escriba desde ahora es otra cotización
         self._reset_cotizacion()
 
-    def enviar_por_correo(self):
-        result = self._crear_pdf_en_carpeta()
-        if result is None:
+    def _generar_cuando_imagenes_listas(self, estado, al_terminar, al_fallar):
+        """Sondea con after() hasta que no quedan conversiones y recién ahí genera."""
+        if self._imagenes_pendientes:
+            self.after(100, self._generar_cuando_imagenes_listas, estado, al_terminar, al_fallar)
             return
+        self._set_botones_pdf("normal")
+        self._generar_pdf_en_segundo_plano(estado, al_terminar, al_fallar)
 
-        numero, cot_dir, file_path, subtotal, igv, total = result
-        self._guardar_en_historial(numero, str(file_path), subtotal, igv, total, "Enviada")
+    def _on_pdf_done(self, fut, registro, file_path, al_terminar, al_fallar=None):
+        self._set_botones_pdf("normal")
+        try:
+            fut.result()
+        except Exception as e:
+            self.show_error(f"No se pudo generar el PDF {registro['numero']}: {e}")
+            if al_fallar is not None:
+                al_fallar()
+            return
+
+        # Escritura incremental: solo se agrega la nueva línea al historial
+        append_historial(registro)
+        self._agregar_cliente_hist(registro)
 
         try:
             self._abrir_pdf(file_path)
         except Exception as e:
             self.show_error(f"No se pudo abrir el PDF: {e}")
 
-        self._enviar_correo(str(file_path), numero)
-        self._reset_cotizacion()
+        al_terminar(registro, file_path)
+
+    def _set_botones_pdf(self, state):
+        self.btn_generar_pdf.configure(state=state)
+        self.btn_enviar_correo.configure(state=state)
+        # Barra indeterminada visible solo mientras el worker genera el PDF
+        if state == "disabled":
+            self.pb_pdf.pack(side="right", padx=5)
+            self.pb_pdf.start(15)
+        else:
+            self.pb_pdf.stop()
+            self.pb_pdf.pack_forget()
+
+    def generar_pdf(self):
+        self._generar_pdf_en_segundo_plano(
+            "Generada",
+            lambda registro, _ruta: self.show_success(f"Cotización generada: {registro['numero']}"),
+        )
+
+    def enviar_por_correo(self):
+        # Destinatario y configuración se validan antes de generar el PDF
+        dest = self._pedir_destinatario()
+        if not dest:
+            return
+        # Con el destinatario ya válido, la conexión SMTP (DNS, TLS, login) se
+        # abre en el worker mientras se genera el PDF
+        email_config = dict(self.email_config)
+        calentamiento = self._encolar(self._smtp_pool, self._get_smtp, email_config)
+        self._generar_pdf_en_segundo_plano(
+            "Enviada",
+            lambda registro, ruta: self._enviar_correo(
+                str(ruta), registro["numero"], dest, registro["cliente"], calentamiento
+            ),
+            lambda: self._descartar_calentamiento_smtp(email_config),
+        )
 
 
 # ==== RUN =============================================================
@@ -8,12 +8,22 @@ from pathlib import Path
 from datetime import datetime, date
 import sys
 import os
+import time
 
 # Agregar el directorio padre al path para importar cotizador
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Importar funciones de utilidad (sin importar la GUI completa)
-from cotizador import get_base_dir, load_json_safe, save_json_safe
+from cotizador import (
+    get_base_dir, load_json_safe, save_json_safe,
+    load_historial, append_historial, save_historial, migrar_historial_legacy, iter_historial,
+    actualizar_historial,
+    validar_ruc_peruano, EMAIL_PATTERN, json_dumps, json_loads,
+    a_centavos, a_milesimas, multiplicar_centavos, formatear_centavos, formatear_cantidad,
+    formatear_monto,
+    nombre_archivo_seguro, normalizar_busqueda, load_correlativo, save_correlativo,
+    limpiar_imagenes_temporales, parse_fecha_flexible,
+)
 
 
 class TestUtilidades(unittest.TestCase):
@@ -59,6 +69,49 @@ class TestUtilidades(unittest.TestCase):
             if os.path.exists(fname):
                 os.unlink(fname)
     
+    def test_nombre_archivo_seguro(self):
+        """Verifica limpieza de nombres de cliente para archivos"""
+        self.assertEqual(nombre_archivo_seguro("Perez & Hijos   S.A."), "Perez_Hijos_S.A.")
+        self.assertEqual(nombre_archivo_seguro("Ñandú <Cía>"), "Ñandú_Cía")
+        self.assertEqual(nombre_archivo_seguro("  /?*  "), "SinCliente")
+    
+    def test_normalizar_busqueda(self):
+        """Verifica que la búsqueda de clientes ignora mayúsculas y tildes"""
+        self.assertEqual(normalizar_busqueda("Ñandú S.A."), "nandu s.a.")
+        self.assertEqual(normalizar_busqueda("ACME"), "acme")
+        self.assertEqual(normalizar_busqueda("José"), normalizar_busqueda("JOSE"))
+    
+    def test_correlativo_en_archivo_propio(self):
+        """Verifica que el correlativo se guarda y lee de su propio archivo"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "correlativo.txt"
+            self.assertEqual(load_correlativo(path), 0)
+            save_correlativo(42, path)
+            self.assertEqual(load_correlativo(path), 42)
+            self.assertFalse(path.with_name(path.name + ".tmp").exists())
+    
+    def test_limpiar_imagenes_temporales(self):
+        """Verifica que solo se borran los TMP_ antiguos no excluidos"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            carpeta = Path(tmpdir)
+            viejo = carpeta / "TMP_1_000001.png"
+            en_uso = carpeta / "TMP_1_000002.png"
+            reciente = carpeta / "TMP_1_000003.png"
+            definitiva = carpeta / "COT-2025-00001_item01.png"
+            for p in (viejo, en_uso, reciente, definitiva):
+                p.write_bytes(b"x")
+            hace_dos_dias = time.time() - 2 * 86400
+            for p in (viejo, en_uso, definitiva):
+                os.utime(p, (hace_dos_dias, hace_dos_dias))
+            
+            borradas = limpiar_imagenes_temporales(carpeta, excluir=[str(en_uso)])
+            
+            self.assertEqual(borradas, 1)
+            self.assertFalse(viejo.exists())
+            self.assertTrue(en_uso.exists())
+            self.assertTrue(reciente.exists())
+            self.assertTrue(definitiva.exists())
+    
     def test_save_json_safe_creates_file(self):
         """Verifica que save_json_safe crea el archivo correctamente"""
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -74,6 +127,21 @@ class TestUtilidades(unittest.TestCase):
             
             self.assertEqual(loaded, data)
     
+    def test_save_json_safe_sincronizar(self):
+        """Verifica que con sincronizar se hace fsync y no queda el temporal"""
+        from unittest import mock
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filepath = Path(tmpdir) / "config.json"
+            
+            with mock.patch("os.fsync") as fsync:
+                save_json_safe(filepath, {"a": 1})
+                fsync.assert_not_called()
+                save_json_safe(filepath, {"a": 2}, sincronizar=True)
+                fsync.assert_called_once()
+            
+            self.assertEqual(json.loads(filepath.read_text(encoding="utf-8")), {"a": 2})
+            self.assertEqual(os.listdir(tmpdir), ["config.json"])
+    
     def test_save_json_safe_overwrites_file(self):
         """Verifica que save_json_safe sobrescribe archivos existentes"""
         with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
@@ -139,6 +207,23 @@ class TestValidaciones(unittest.TestCase):
         
         for valor in valores_invalidos:
             self.assertLessEqual(valor, 0)
+    
+    def test_ruc_peruano_digito_verificador(self):
+        """Verifica RUC con dígito verificador correcto e incorrecto"""
+        self.assertTrue(validar_ruc_peruano("20100070970"))
+        self.assertFalse(validar_ruc_peruano("20100070971"))
+        self.assertFalse(validar_ruc_peruano("2010007097"))
+    
+    def test_ruc_peruano_rechaza_digitos_unicode(self):
+        """Verifica que dígitos no ASCII no pasan la validación ni fallan"""
+        self.assertFalse(validar_ruc_peruano("2010007097²"))
+        self.assertFalse(validar_ruc_peruano("٢٠١٠٠٠٧٠٩٧٠"))
+    
+    def test_email_pattern_completo(self):
+        """Verifica que el patrón de email valida la cadena completa"""
+        self.assertTrue(EMAIL_PATTERN.fullmatch("usuario@ejemplo.com"))
+        self.assertFalse(EMAIL_PATTERN.fullmatch("usuario@ejemplo.com otro"))
+        self.assertFalse(EMAIL_PATTERN.fullmatch("usuario@ejemplo"))
 
 
 class TestCalculos(unittest.TestCase):
@@ -197,6 +282,51 @@ class TestCalculos(unittest.TestCase):
             self.assertEqual(redondeado, round(redondeado, 2))
 
 
+class TestCentavos(unittest.TestCase):
+    """Tests para la aritmética de montos en centavos enteros"""
+    
+    def test_a_centavos_redondea(self):
+        """Verifica conversión y redondeo mitad hacia arriba"""
+        self.assertEqual(a_centavos("12.345"), 1235)
+        self.assertEqual(a_centavos(2), 200)
+        self.assertEqual(a_centavos(0.1), 10)
+        with self.assertRaises(ValueError):
+            a_centavos("abc")
+    
+    def test_suma_sin_error_de_float(self):
+        """Verifica que sumar centavos no acumula error de punto flotante"""
+        total_c = sum(multiplicar_centavos(1000, a_centavos("0.10")) for _ in range(3))
+        self.assertEqual(formatear_centavos(total_c), "0.30")
+    
+    def test_cantidad_con_tres_decimales(self):
+        """Verifica que la cantidad conserva 3 decimales en milésimas"""
+        self.assertEqual(a_milesimas("0.125"), 125)
+        self.assertEqual(a_milesimas("12.3456"), 12346)
+        self.assertEqual(a_milesimas(2), 2000)
+        # 0.125 x 9.99 = 1.24875 -> 1.25
+        self.assertEqual(multiplicar_centavos(a_milesimas("0.125"), a_centavos("9.99")), 125)
+        with self.assertRaises(ValueError):
+            a_milesimas("abc")
+    
+    def test_formatear_cantidad(self):
+        """Verifica que la cantidad muestra 3 decimales solo si hacen falta"""
+        self.assertEqual(formatear_cantidad(2000), "2.00")
+        self.assertEqual(formatear_cantidad(2500), "2.50")
+        self.assertEqual(formatear_cantidad(125), "0.125")
+        self.assertEqual(formatear_cantidad(-12345), "-12.345")
+    
+    def test_formatear_centavos(self):
+        """Verifica formato con y sin separador de miles"""
+        self.assertEqual(formatear_centavos(123456), "1234.56")
+        self.assertEqual(formatear_centavos(123456, miles=True), "1,234.56")
+        self.assertEqual(formatear_centavos(-5), "-0.05")
+    
+    def test_formatear_monto_con_simbolo(self):
+        """Verifica el formato de montos con símbolo de moneda"""
+        self.assertEqual(formatear_monto("S/", 123456), "S/ 1,234.56")
+        self.assertEqual(formatear_monto("$", 0), "$ 0.00")
+
+
 class TestFormateoMoneda(unittest.TestCase):
     """Tests para formateo de valores monetarios"""
     
@@ -256,6 +386,16 @@ class TestFechas(unittest.TestCase):
         self.assertEqual(fecha_obj.month, 12)
         self.assertEqual(fecha_obj.day, 4)
     
+    def test_parse_fecha_flexible(self):
+        """Verifica los formatos aceptados por parse_fecha_flexible"""
+        self.assertEqual(parse_fecha_flexible("2025-12-04 10:30"), date(2025, 12, 4))
+        self.assertEqual(parse_fecha_flexible("04/12/2025"), date(2025, 12, 4))
+        self.assertEqual(parse_fecha_flexible("2025-1-4"), date(2025, 1, 4))
+        self.assertIsNone(parse_fecha_flexible("2025-13-40"))
+        self.assertIsNone(parse_fecha_flexible(""))
+        # Memorizada: la misma cadena devuelve el mismo objeto
+        self.assertIs(parse_fecha_flexible("04/12/2025"), parse_fecha_flexible("04/12/2025"))
+    
     def test_comparacion_fechas(self):
         """Verifica comparación de fechas"""
         fecha1 = date(2025, 1, 1)
@@ -309,6 +449,26 @@ class TestConfiguracion(unittest.TestCase):
         
         for valor in valores_invalidos:
             self.assertTrue(valor < 0 or valor > 1)
+    
+    def test_io_worker_escribe_ultima_version(self):
+        """Verifica que el hilo de E/S escribe la última versión de cada archivo"""
+        import queue
+        import threading
+        import types
+        from cotizador import CotizadorApp
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, borrador = Path(tmpdir) / "config.json", Path(tmpdir) / "borrador.json"
+            app = types.SimpleNamespace(_io_queue=queue.Queue())
+            for i in range(5):
+                app._io_queue.put((config, {"v": i}, True))
+            app._io_queue.put((borrador, {"items": []}, False))
+            
+            threading.Thread(target=CotizadorApp._io_worker, args=(app,), daemon=True).start()
+            app._io_queue.join()
+            
+            self.assertEqual(load_json_safe(config, None), {"v": 4})
+            self.assertEqual(load_json_safe(borrador, None), {"items": []})
 
 
 class TestSerie(unittest.TestCase):
@@ -366,9 +526,355 @@ class TestHistorial(unittest.TestCase):
             self.assertTrue(len(estado) > 0)
 
 
+class TestHistorialJsonl(unittest.TestCase):
+    """Tests para el historial en formato JSON Lines"""
+    
+    def test_append_agrega_una_linea_por_registro(self):
+        """Verifica que append_historial agrega sin reescribir"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "hist.jsonl"
+            append_historial({"numero": "COT-2025-00001"}, path)
+            append_historial({"numero": "COT-2025-00002", "cliente": "Señor Ñandú"}, path)
+            
+            lineas = path.read_text(encoding="utf-8").splitlines()
+            self.assertEqual(len(lineas), 2)
+            self.assertEqual(
+                load_historial(path),
+                [{"numero": "COT-2025-00001"},
+                 {"numero": "COT-2025-00002", "cliente": "Señor Ñandú"}]
+            )
+    
+    def test_load_historial_inexistente(self):
+        """Verifica que un historial inexistente se lee como lista vacía"""
+        self.assertEqual(load_historial(Path("/ruta/inexistente/hist.jsonl")), [])
+    
+    def test_load_historial_omite_linea_corrupta(self):
+        """Verifica que una línea truncada no invalida todo el historial"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "hist.jsonl"
+            path.write_text('{"numero": "A"}\n\n{"numero": "B"', encoding="utf-8")
+            
+            self.assertEqual(load_historial(path), [{"numero": "A"}])
+    
+    def test_append_tras_linea_cortada(self):
+        """Verifica que el primer registro tras una escritura cortada no se pierde"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "hist.jsonl"
+            path.write_text('{"numero": "A"}\n{"numero": "B"', encoding="utf-8")
+            
+            append_historial({"numero": "C"}, path)
+            append_historial({"numero": "D"}, path)
+            
+            self.assertEqual(
+                [r["numero"] for r in load_historial(path)], ["A", "C", "D"]
+            )
+    
+    def test_save_historial_reescribe(self):
+        """Verifica que save_historial reemplaza el contenido"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "hist.jsonl"
+            append_historial({"numero": "A", "estado": "Generada"}, path)
+            save_historial([{"numero": "A", "estado": "Enviada"}], path)
+            
+            self.assertEqual(load_historial(path), [{"numero": "A", "estado": "Enviada"}])
+            # Escritura atómica: no debe quedar el temporal
+            self.assertEqual([p.name for p in Path(tmpdir).iterdir()], ["hist.jsonl"])
+    
+    def test_actualizar_historial_conserva_registros_nuevos(self):
+        """Verifica que editar no pierde lo agregado después de tomar la lista"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "hist.jsonl"
+            append_historial({"numero": "A", "estado": "Generada"}, path)
+            foto = load_historial(path)  # Ventana de historial abierta
+            append_historial({"numero": "B", "estado": "Generada"}, path)
+            
+            def marcar(r):
+                if r["numero"] != foto[0]["numero"]:
+                    return False
+                r["estado"] = "Aceptada"
+                return True
+            
+            self.assertEqual(actualizar_historial(marcar, path), 1)
+            self.assertEqual(
+                list(iter_historial(path)),
+                [{"numero": "A", "estado": "Aceptada"}, {"numero": "B", "estado": "Generada"}]
+            )
+    
+    def test_load_historial_reutiliza_cache(self):
+        """Verifica que el historial se reparsea solo si el archivo cambió"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "hist.jsonl"
+            append_historial({"numero": "A"}, path)
+            
+            primera = load_historial(path)
+            segunda = load_historial(path)
+            self.assertIs(primera[0], segunda[0])
+            
+            append_historial({"numero": "B"}, path)
+            tercera = load_historial(path)
+            self.assertEqual(tercera, [{"numero": "A"}, {"numero": "B"}])
+            # Las escrituras propias actualizan el caché sin reparsear el archivo
+            self.assertIs(tercera[0], primera[0])
+            
+            save_historial(tercera[:1], path)
+            self.assertIs(load_historial(path)[0], primera[0])
+            self.assertEqual(list(iter_historial(path)), [{"numero": "A"}])
+            
+            # Cambio externo (otro proceso) detectado por mtime/tamaño
+            path.write_text('{"numero": "C"}\n', encoding="utf-8")
+            self.assertEqual(load_historial(path), [{"numero": "C"}])
+    
+    def test_json_con_y_sin_orjson(self):
+        """Verifica que la serialización es igual con orjson o con json estándar"""
+        from unittest import mock
+        import cotizador
+        registro = {"numero": "A", "cliente": "Señor Ñandú", "total": 118.5}
+        
+        texto = json_dumps(registro)
+        with mock.patch.object(cotizador, "orjson", None):
+            texto_std = json_dumps(registro)
+            self.assertEqual(json_loads(texto), registro)
+        
+        self.assertEqual(json_loads(texto_std), registro)
+        self.assertIn("Ñandú", texto_std)
+    
+    def test_migracion_desde_lista_json(self):
+        """Verifica la conversión del historial antiguo a JSON Lines"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            legacy = Path(tmpdir) / "hist.json"
+            path = Path(tmpdir) / "hist.jsonl"
+            registros = [{"numero": "A"}, {"numero": "B"}]
+            legacy.write_text(json.dumps(registros), encoding="utf-8")
+            
+            migrar_historial_legacy(legacy, path)
+            
+            self.assertEqual(load_historial(path), registros)
+            self.assertFalse(legacy.exists())
+            self.assertTrue((Path(tmpdir) / "hist.json.bak").exists())
+    
+    def test_migracion_fallida_conserva_legacy(self):
+        """Verifica que si no se escribe el JSON Lines el archivo antiguo queda"""
+        from unittest import mock
+        import cotizador
+        with tempfile.TemporaryDirectory() as tmpdir:
+            legacy = Path(tmpdir) / "hist.json"
+            path = Path(tmpdir) / "hist.jsonl"
+            legacy.write_text(json.dumps([{"numero": "A"}]), encoding="utf-8")
+            
+            with mock.patch.object(cotizador.os, "replace", side_effect=OSError):
+                migrar_historial_legacy(legacy, path)
+            self.assertTrue(legacy.exists())
+            self.assertFalse(path.exists())
+            
+            # En el siguiente inicio se reintenta
+            migrar_historial_legacy(legacy, path)
+            self.assertEqual(load_historial(path), [{"numero": "A"}])
+            self.assertFalse(legacy.exists())
+
+
 class TestIntegracion(unittest.TestCase):
     """Tests de integración básicos"""
     
+    def test_cierre_no_bloquea_con_trabajo_en_curso(self):
+        """Verifica que cerrar con un trabajo en curso no bloquea el hilo de Tk"""
+        import queue
+        import threading
+        import types
+        from concurrent.futures import ThreadPoolExecutor
+        from cotizador import CotizadorApp
+        
+        programados = []
+        app = types.SimpleNamespace(
+            _fin_pools=None, _io_queue=queue.Queue(), cerrada=False,
+            _pdf_pool=ThreadPoolExecutor(max_workers=1),
+            _smtp_pool=ThreadPoolExecutor(max_workers=1),
+            _img_pool=ThreadPoolExecutor(max_workers=1),
+            after=lambda ms, fn, *args: programados.append((fn, args)),
+            show_info=lambda mensaje: None,
+            _cerrar_smtp=lambda: None,
+        )
+        app.destroy = lambda: setattr(app, "cerrada", True)
+        app._esperar_pools_y_cerrar = CotizadorApp._esperar_pools_y_cerrar.__get__(app)
+        
+        seguir = threading.Event()
+        imagen = threading.Event()
+        app._pdf_pool.submit(seguir.wait, 5)
+        app._smtp_pool.submit(seguir.wait, 5)
+        app._img_pool.submit(imagen.wait, 5)
+        
+        CotizadorApp._on_close(app)  # Vuelve enseguida aunque el trabajo siga en curso
+        self.assertFalse(app.cerrada)
+        self.assertEqual(len(programados), 1)
+        
+        # Con PDF y correo libres todavía espera a la conversión de imagen
+        seguir.set()
+        app._fin_pools[app._pdf_pool].result(timeout=5)
+        app._fin_pools[app._smtp_pool].result(timeout=5)
+        fn, args = programados.pop(0)
+        fn(*args)
+        self.assertFalse(app.cerrada)
+        self.assertEqual(len(programados), 1)
+        
+        imagen.set()
+        for _ in range(200):
+            fn, args = programados.pop(0)
+            fn(*args)
+            if app.cerrada:
+                break
+            time.sleep(0.01)
+        self.assertTrue(app.cerrada)
+    
+    def test_cierre_espera_trabajo_encolado_por_callback(self):
+        """Verifica que el cierre espera el correo que encola el callback del PDF"""
+        import queue
+        import threading
+        import types
+        from concurrent.futures import ThreadPoolExecutor
+        from cotizador import CotizadorApp
+        
+        programados = []
+        app = types.SimpleNamespace(
+            _fin_pools=None, _io_queue=queue.Queue(), cerrada=False,
+            _pdf_pool=ThreadPoolExecutor(max_workers=1),
+            _smtp_pool=ThreadPoolExecutor(max_workers=1),
+            _img_pool=ThreadPoolExecutor(max_workers=1),
+            after=lambda ms, fn, *args: programados.append((fn, args)),
+            show_info=lambda mensaje: None,
+            _cerrar_smtp=lambda: None,
+        )
+        app.destroy = lambda: setattr(app, "cerrada", True)
+        app._esperar_pools_y_cerrar = CotizadorApp._esperar_pools_y_cerrar.__get__(app)
+        app._encolar = CotizadorApp._encolar.__get__(app)
+        
+        pdf_listo = threading.Event()
+        correo_listo = threading.Event()
+        encolados = []
+        
+        def al_terminar_pdf():
+            encolados.append(app._encolar(app._smtp_pool, correo_listo.wait, 5))
+        
+        fut = app._encolar(app._pdf_pool, pdf_listo.wait, 5)
+        fut.add_done_callback(lambda f: app.after(0, al_terminar_pdf))
+        
+        CotizadorApp._on_close(app)
+        pdf_listo.set()
+        fut.result(timeout=5)
+        
+        # Hasta que el correo encolado al cerrar no termine, solo se sigue sondeando
+        for _ in range(20):
+            fn, args = programados.pop(0)
+            fn(*args)
+            self.assertFalse(app.cerrada)
+        self.assertEqual(len(encolados), 1)
+        self.assertFalse(encolados[0].done())
+        
+        correo_listo.set()
+        for _ in range(200):
+            fn, args = programados.pop(0)
+            fn(*args)
+            if app.cerrada:
+                break
+            time.sleep(0.01)
+        self.assertTrue(app.cerrada)
+        self.assertTrue(encolados[0].done())
+    
+    def test_generar_pdf_no_bloquea_con_imagenes_pendientes(self):
+        """Verifica que generar con imágenes en conversión se posterga con after()"""
+        import types
+        from cotizador import CotizadorApp
+        
+        programados = []
+        preparados = []
+        botones = []
+        app = types.SimpleNamespace(
+            _imagenes_pendientes={"conversion"},
+            after=lambda ms, fn, *args: programados.append((fn, args)),
+            show_info=lambda mensaje: None,
+            _set_botones_pdf=botones.append,
+            _preparar_datos_pdf=lambda: preparados.append(True),
+        )
+        app._generar_pdf_en_segundo_plano = CotizadorApp._generar_pdf_en_segundo_plano.__get__(app)
+        app._generar_cuando_imagenes_listas = CotizadorApp._generar_cuando_imagenes_listas.__get__(app)
+        
+        app._generar_pdf_en_segundo_plano("Generada", lambda *args: None)
+        self.assertEqual(preparados, [])
+        self.assertEqual(botones, ["disabled"])
+        
+        # Mientras siga la conversión solo vuelve a programarse
+        fn, args = programados.pop(0)
+        fn(*args)
+        self.assertEqual(preparados, [])
+        self.assertEqual(len(programados), 1)
+        
+        app._imagenes_pendientes.clear()
+        fn, args = programados.pop(0)
+        fn(*args)
+        self.assertEqual(preparados, [True])
+        self.assertEqual(botones, ["disabled", "normal"])
+    
+    def test_generar_pdf_limpia_formulario_al_enviar_trabajo(self):
+        """Verifica que el formulario se limpia al tomar la foto y no al terminar"""
+        import threading
+        import types
+        from concurrent.futures import ThreadPoolExecutor
+        from cotizador import CotizadorApp
+        
+        programados = []
+        limpiezas = []
+        dibujar = threading.Event()
+        app = types.SimpleNamespace(
+            _imagenes_pendientes=set(), _fin_pools=None,
+            _pdf_pool=ThreadPoolExecutor(max_workers=1),
+            after=lambda ms, fn, *args: programados.append((fn, args)),
+            show_info=lambda mensaje: None,
+            _set_botones_pdf=lambda state: None,
+            _preparar_datos_pdf=lambda: {"numero": "COT-1", "file_path": Path("c.pdf"),
+                                         "subtotal": 0, "igv": 0, "total": 0},
+            _armar_registro_historial=lambda numero, *args: {"numero": numero},
+            _renderizar_pdf=lambda datos: dibujar.wait(5),
+            _reset_cotizacion=lambda: limpiezas.append(True),
+            _on_pdf_done=lambda *args: None,
+        )
+        app._encolar = CotizadorApp._encolar.__get__(app)
+        
+        CotizadorApp._generar_pdf_en_segundo_plano(app, "Generada", lambda *args: None)
+        # El worker sigue dibujando y el formulario ya quedó libre
+        self.assertEqual(limpiezas, [True])
+        self.assertEqual(programados, [])
+        
+        dibujar.set()
+        app._pdf_pool.shutdown(wait=True)
+        fn, args = programados.pop(0)
+        self.assertEqual(fn, app._on_pdf_done)
+        self.assertEqual(args[1], {"numero": "COT-1"})
+    
+    def test_envio_no_reconecta_si_fallo_la_conexion_anticipada(self):
+        """Verifica que un fallo al conectar antes no repite la espera al enviar"""
+        import types
+        from concurrent.futures import Future
+        from email.message import EmailMessage
+        from cotizador import CotizadorApp
+        
+        conexiones = []
+        app = types.SimpleNamespace(
+            _get_smtp=lambda config: conexiones.append(config),
+            _cerrar_smtp=lambda: None,
+        )
+        calentamiento = Future()
+        calentamiento.set_exception(OSError("timed out"))
+        msg = EmailMessage()
+        msg["From"], msg["To"] = "a@b.com", "c@d.com"
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pdf_path = Path(tmpdir) / "c.pdf"
+            pdf_path.write_bytes(b"%PDF-1.4\n")
+            error = CotizadorApp._enviar_mensaje(
+                app, msg, str(pdf_path), "COT-1", {}, calentamiento
+            )
+        
+        self.assertIn("timed out", error)
+        self.assertEqual(conexiones, [])
+    
     def test_flujo_cotizacion_completo(self):
         """Verifica el flujo básico de una cotización"""
         # Datos de entrada
@@ -410,11 +916,13 @@ def suite():
     test_suite.addTest(unittest.makeSuite(TestUtilidades))
     test_suite.addTest(unittest.makeSuite(TestValidaciones))
     test_suite.addTest(unittest.makeSuite(TestCalculos))
+    test_suite.addTest(unittest.makeSuite(TestCentavos))
     test_suite.addTest(unittest.makeSuite(TestFormateoMoneda))
     test_suite.addTest(unittest.makeSuite(TestFechas))
     test_suite.addTest(unittest.makeSuite(TestConfiguracion))
     test_suite.addTest(unittest.makeSuite(TestSerie))
     test_suite.addTest(unittest.makeSuite(TestHistorial))
+    test_suite.addTest(unittest.makeSuite(TestHistorialJsonl))
     test_suite.addTest(unittest.makeSuite(TestIntegracion))
     
     return test_suite
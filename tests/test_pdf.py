@@ -227,6 +227,41 @@ class TestValidacionPDF(unittest.TestCase):
             if os.path.exists(fname):
                 os.unlink(fname)
     
+    def test_partir_lineas_pdf_memoriza(self):
+        """Verifica que el ajuste de texto se calcula una vez por texto y fuente"""
+        from cotizador import CotizadorPDF, partir_lineas_pdf
+        
+        pdf = CotizadorPDF({"nombre": "Test"}, numero="COT-2024-00001")
+        pdf.add_page()
+        pdf.set_font("Helvetica", "", 10)
+        texto = "Descripción larga de producto " * 5
+        
+        lineas = partir_lineas_pdf(pdf, 80, 6, texto)
+        self.assertGreater(len(lineas), 1)
+        self.assertEqual(list(lineas), pdf.multi_cell(80, 6, texto, split_only=True))
+        self.assertIs(partir_lineas_pdf(pdf, 80, 6, texto), lineas)
+    
+    def test_cota_lineas_pdf_no_subestima(self):
+        """Verifica que la cota de líneas nunca es menor que el ajuste real"""
+        import random
+        from cotizador import CotizadorPDF, cota_lineas_pdf, partir_lineas_pdf
+        
+        pdf = CotizadorPDF({"nombre": "Test"}, numero="COT-2024-00001")
+        pdf.add_page()
+        pdf.set_font("Helvetica", "", 10)
+        palabras = ["a", "de", "tornillo", "acero", "inoxidable", "M8x40mm",
+                    "galvanizado", "Ñandú", "Supercalifragilisticoespialidoso", ""]
+        azar = random.Random(7)
+        for _ in range(300):
+            texto = " ".join(azar.choice(palabras) for _ in range(azar.randint(1, 60)))
+            if azar.random() < 0.3:
+                texto += "\n" + " ".join(azar.choice(palabras) for _ in range(azar.randint(1, 10)))
+            lineas = len(partir_lineas_pdf(pdf, 80, 6, texto))
+            self.assertGreaterEqual(cota_lineas_pdf(pdf, 80, texto), lineas, texto)
+        
+        # Una palabra casi tan ancha como la celda no tiene cota
+        self.assertEqual(cota_lineas_pdf(pdf, 80, "x" * 60), float("inf"))
+    
     def test_pdf_puede_abrirse(self):
         """Verifica que PDF puede abrirse"""
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f: